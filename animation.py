@@ -0,0 +1,263 @@
+"""
+Animação de pontos ao longo do tempo sobre um mapa estático.
+
+Os pontos são agrupados em períodos (dia, semana, mês...) de uma só vez: o
+período de cada linha vira um número inteiro, as linhas são ordenadas por
+ele e cada quadro corresponde a uma fatia contígua desse vetor, sem cópias.
+
+A malha, a legenda e a rosa dos ventos são desenhadas uma única vez; o
+fundo resultante é guardado (copy_from_bbox) e, a cada quadro, restaurado
+antes de desenhar apenas os marcadores do período e o rótulo da data
+(blitting). Cada quadro é enviado ao codificador assim que fica pronto:
+
+- 'frames': sequência de PNGs em um diretório;
+- 'mp4' e 'gif': ffmpeg, recebendo os pixels brutos por um pipe.
+
+A memória usada fica constante, qualquer que seja o número de quadros.
+Sem o ffmpeg, o GIF é montado pelo PIL, que guarda todos os quadros até o
+fim (em paleta, 1 byte por pixel).
+
+Marcadores de imagem não são animados: a camada usa o símbolo e a cor.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+try:
+    from matplotlib._tight_bbox import adjust_bbox
+except ImportError:  # matplotlib < 3.6
+    from matplotlib.tight_bbox import adjust_bbox
+
+from map_utils import (
+    PointLayer, base_map_key, build_map_figure, encode_png, get_tight_bbox,
+    map_layout_key
+)
+from metrics import span
+from projection import project_points
+from rendering import render_context
+
+logger = logging.getLogger(__name__)
+
+# Formatos de saída animados
+ANIMATION_FORMATS = ('mp4', 'gif', 'frames')
+
+# Executável do ffmpeg
+FFMPEG_BIN = os.environ.get('PYMAPS_FFMPEG', 'ffmpeg')
+
+# Resolução dos quadros (a das imagens estáticas gera quadros de vários MB)
+ANIMATION_DPI = float(os.environ.get('PYMAPS_ANIMATION_DPI', 100))
+
+# Limite de quadros por animação (períodos entre a primeira e a última data)
+MAX_ANIMATION_FRAMES = int(os.environ.get('PYMAPS_MAX_ANIMATION_FRAMES', 2000))
+
+@dataclass
+class TimeBuckets:
+    """Linhas ordenadas por período; os pontos do quadro i são rows[bounds[i]:bounds[i + 1]]."""
+    labels: pd.PeriodIndex
+    rows: np.ndarray
+    bounds: np.ndarray
+
+    def __len__(self):
+        return len(self.labels)
+
+    def frame_slice(self, index: int, cumulative: bool = False) -> slice:
+        """Posições do quadro em rows (desde o início, se cumulative)."""
+        start = 0 if cumulative else int(self.bounds[index])
+        return slice(start, int(self.bounds[index + 1]))
+
+def time_buckets(dates, freq: str = 'M') -> TimeBuckets:
+    """
+    Agrupa as linhas por período (freq do pandas: 'D', 'W', 'M', 'Q', 'Y').
+    Todos os períodos entre a primeira e a última data viram quadros, mesmo
+    os sem pontos; linhas sem data válida ficam de fora.
+    """
+    dates = pd.to_datetime(pd.Series(dates, copy=False).reset_index(drop=True),
+                           errors='coerce')
+    valid = dates.notna().to_numpy()
+    if not valid.any():
+        return TimeBuckets(pd.PeriodIndex([], freq=freq), np.empty(0, dtype=np.int64),
+                           np.zeros(1, dtype=np.int64))
+
+    ordinals = pd.PeriodIndex(dates[valid], freq=freq).asi8
+    first = ordinals.min()
+    codes = ordinals - first
+    n_frames = int(codes.max()) + 1
+    if n_frames > MAX_ANIMATION_FRAMES:
+        raise ValueError(f"Animação com {n_frames} quadros excede o limite de "
+                         f"{MAX_ANIMATION_FRAMES}; use um período maior")
+
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=n_frames)
+    labels = pd.period_range(start=pd.Period(ordinal=first, freq=freq), periods=n_frames)
+    return TimeBuckets(labels, np.flatnonzero(valid)[order], np.r_[0, np.cumsum(counts)])
+
+class PngSequenceWriter:
+    """Grava cada quadro como PNG em um diretório."""
+
+    def __init__(self, path):
+        self.path = path
+        self.bytes = 0
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, rgba):
+        content = encode_png(np.ascontiguousarray(rgba))
+        with open(os.path.join(self.path, f'quadro_{self.count:05d}.png'), 'wb') as f:
+            f.write(content)
+        self.bytes += len(content)
+        self.count += 1
+
+    def close(self) -> int:
+        return self.bytes
+
+class FFmpegWriter:
+    """Envia os pixels RGBA de cada quadro ao ffmpeg por um pipe."""
+
+    CODEC_ARGS = {
+        'mp4': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart'],
+        'gif': ['-vf', 'split[a][b];[a]palettegen[p];[b][p]paletteuse'],
+    }
+
+    def __init__(self, path, format, fps, width, height):
+        self.path = path
+        command = [FFMPEG_BIN, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+                   '-r', str(fps), '-i', '-', *self.CODEC_ARGS[format], path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+
+    def write(self, rgba):
+        self.process.stdin.write(np.ascontiguousarray(rgba).data)
+
+    def close(self) -> int:
+        self.process.stdin.close()
+        error = self.process.stderr.read().decode('utf-8', 'replace')
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg falhou: {error.strip()}")
+        return os.path.getsize(self.path)
+
+class GifWriter:
+    """GIF pelo PIL (sem ffmpeg): os quadros ficam em memória, em paleta."""
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.duration = int(1000 / fps)
+        self.frames = []
+
+    def write(self, rgba):
+        img = Image.fromarray(np.ascontiguousarray(rgba), 'RGBA').convert('RGB')
+        self.frames.append(img.quantize(colors=256, method=Image.FASTOCTREE))
+
+    def close(self) -> int:
+        if self.frames:
+            self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:],
+                                duration=self.duration, loop=0, optimize=False)
+        self.frames = []
+        return os.path.getsize(self.path)
+
+def open_writer(path, format, fps, width, height):
+    """Codificador de quadros para o formato pedido."""
+    if format == 'frames':
+        return PngSequenceWriter(path)
+    if shutil.which(FFMPEG_BIN):
+        return FFmpegWriter(path, format, fps, width, height)
+    if format == 'gif':
+        logger.warning("ffmpeg não encontrado: GIF montado em memória pelo PIL")
+        return GifWriter(path, fps)
+    raise RuntimeError(f"ffmpeg não encontrado ({FFMPEG_BIN}); necessário para {format}")
+
+def _frame_box(canvas, even=False):
+    """Fatias (linhas, colunas) do quadro no buffer do canvas."""
+    width, height = (int(v) for v in canvas.get_width_height())
+    if even:
+        # H.264 em yuv420p exige largura e altura pares
+        width -= width % 2
+        height -= height % 2
+    return slice(0, height), slice(0, width)
+
+def render_animation(gdf_base, area_name, latitudes, longitudes, dates, output,
+                     format='mp4', freq='M', fps=4, cumulative=False, layer_name='Pontos',
+                     marker_style='o', color_marker='#f9b347', marker_size=1.0,
+                     color_map='#044c6d', color_border='#ffffff', border_thickness=1,
+                     show_axes=False, show_legend=True, show_compass=True,
+                     area_key=None, crs=None) -> Dict:
+    """
+    Renderiza a animação dos pontos por período em output (arquivo ou, para
+    'frames', diretório). Com cumulative, cada quadro mostra também os
+    pontos dos períodos anteriores. Retorna o número de quadros, o tamanho
+    da saída e os tempos de desenho da base e dos quadros.
+    """
+    if format not in ANIMATION_FORMATS:
+        raise ValueError(f"Formato de animação inválido: {format}")
+    buckets = time_buckets(dates, freq)
+    if len(buckets) == 0:
+        raise ValueError("Nenhuma data válida para animar")
+
+    # Coordenadas projetadas uma vez e já na ordem dos quadros
+    x, y = project_points(longitudes, latitudes, crs)
+    x, y = np.asarray(x)[buckets.rows], np.asarray(y)[buckets.rows]
+
+    layers = [PointLayer(layer_name, [], [], marker_style, color_marker, marker_size)]
+    extent_key = map_layout_key(gdf_base, area_name, show_axes, show_legend, show_compass,
+                                border_thickness, layers, crs)
+    base_key = base_map_key(area_key, color_map, color_border, border_thickness, crs)
+    report = {'frames': len(buckets)}
+
+    with render_context(show_axes, show_legend, show_compass, base_key) as template:
+        start = time.perf_counter()
+        fig = build_map_figure(gdf_base, area_name, color_map=color_map,
+                               color_border=color_border, border_thickness=border_thickness,
+                               show_axes=show_axes, show_legend=show_legend,
+                               show_compass=show_compass, layers=layers, template=template,
+                               base_key=base_key, crs=crs, area_key=area_key)
+        if fig is None:
+            raise RuntimeError("Falha ao gerar figura do mapa")
+        ax = template.ax
+        canvas = fig.canvas
+
+        # Como no savefig(bbox_inches=...): o canvas passa a ser só a área útil,
+        # na resolução das animações
+        bbox = get_tight_bbox(fig, extent_key)
+        figure_dpi = fig.dpi
+        fig.set_dpi(ANIMATION_DPI)
+        restore_bbox = adjust_bbox(fig, bbox)
+        try:
+            # Base, legenda e rosa dos ventos: desenhadas uma única vez
+            canvas.draw()
+            background = canvas.copy_from_bbox(fig.bbox)
+            markers = ax.scatter([], [], c=color_marker, s=(marker_size * 10) ** 2,
+                                 marker=marker_style, animated=True)
+            label = ax.text(0.02, 0.98, '', transform=ax.transAxes, ha='left', va='top',
+                            fontsize=14, animated=True,
+                            bbox={'facecolor': 'white', 'alpha': 0.8, 'edgecolor': 'none'})
+            rows, cols = _frame_box(canvas, even=format == 'mp4')
+            report['base_s'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            writer = open_writer(output, format, fps, cols.stop, rows.stop)
+            try:
+                with span('animation'):
+                    for index, period in enumerate(buckets.labels):
+                        frame = buckets.frame_slice(index, cumulative)
+                        canvas.restore_region(background)
+                        markers.set_offsets(np.column_stack([x[frame], y[frame]]))
+                        label.set_text(str(period))
+                        ax.draw_artist(markers)
+                        ax.draw_artist(label)
+                        writer.write(np.asarray(canvas.buffer_rgba())[rows, cols])
+            finally:
+                report['bytes'] = writer.close()
+            report['frames_s'] = time.perf_counter() - start
+        finally:
+            restore_bbox()
+            fig.set_dpi(figure_dpi)
+
+    return report
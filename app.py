@@ -1,20 +1,29 @@
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, ClientsideFunction
 import dash_bootstrap_components as dbc
 import pandas as pd
 import traceback
+import base64
 import logging
+import time
+import uuid
 from layout import app_layout
 from data_utils import (
     get_regions, get_ufs_by_region, get_all_municipios,
-    get_municipios_by_uf, get_ufs, load_data_from_contents,
-    get_area_name
+    get_municipios_by_uf, get_ufs, load_data_from_contents
 )
 from map_utils import (
-    generate_brazil_map, generate_region_map,
-    generate_uf_with_municipios_map, generate_municipio_map,
-    add_points_to_map, filter_points_by_area, optimize_marker_image
+    get_area_map, render_map_image, optimize_marker_image
 )
+from rendering import RenderCancelled
+from layers import LayerStack
+from vector import vector_payload
+from coordinates import clean_coordinates
+from gazetteer import geocode_municipios
+from image_store import store_image, load_image, cached_image_url
+import image_store
+import coalescing
+import metrics
 
 # Configuração de logging
 logging.basicConfig(
@@ -23,11 +32,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+try:
+    import flask_compress  # noqa: F401
+    COMPRESS = True  # Respostas dos callbacks (p.ex. o mapa vetorial) com gzip
+except ImportError:
+    COMPRESS = False
+
 # Inicialização do app
 app = dash.Dash(
     __name__,
     external_stylesheets=[dbc.themes.BOOTSTRAP, '/assets/styles.css'],
     suppress_callback_exceptions=True,
+    compress=COMPRESS,
     title="PyMaps"
 )
 
@@ -35,9 +51,28 @@ app = dash.Dash(
 server = app.server
 server.config['SEND_FILE_MAX_AGE_DEFAULT'] = 43200  # 12 horas
 
+# Métricas em /metrics e tempos por etapa no cabeçalho Server-Timing
+metrics.init_app(server)
+
+# Imagens dos mapas servidas por URL (/mapas/<hash>.png), com cache HTTP
+image_store.init_app(server)
+
 # Layout
 app.layout = app_layout
 
+# Primeira etapa do mapa invalidada por cada entrada: 'area' refaz tudo a
+# partir da malha, 'layers' refiltra só a camada nova e 'style' só redesenha
+# (as etapas anteriores vêm dos caches, chaveados pelas próprias entradas)
+MAP_INPUT_STAGES = {
+    'pais-dropdown': 'area',
+    'regiao-dropdown': 'area',
+    'uf-dropdown': 'area',
+    'municipios-dropdown': 'area',
+    'projection-dropdown': 'area',
+    'layers-render': 'layers',
+    'map-style': 'style',
+}
+
 # Callbacks
 @app.callback(
     Output('uf-dropdown', 'options'),
@@ -85,7 +120,8 @@ def update_municipios_dropdown(uf_id):
 @app.callback(
     [Output('uploaded-data-store', 'data'),
      Output('latitude-column', 'options'),
-     Output('longitude-column', 'options')],
+     Output('longitude-column', 'options'),
+     Output('municipio-column', 'options')],
     [Input('upload-data', 'contents')],
     [State('upload-data', 'filename')]
 )
@@ -95,13 +131,13 @@ def store_uploaded_data(contents, filename):
         try:
             df = load_data_from_contents(contents, filename)
             if df is None:
-                return None, [], []
+                return None, [], [], []
             options = [{'label': col, 'value': col} for col in df.columns]
-            return df.to_dict('records'), options, options
+            return df.to_dict('records'), options, options, options
         except Exception as e:
             logger.error(f"Erro no processamento do arquivo: {e}")
-            return None, [], []
-    return None, [], []
+            return None, [], [], []
+    return None, [], [], []
 
 @app.callback(
     Output('uploaded-marker-image-store', 'data'),
@@ -118,93 +154,298 @@ def store_uploaded_marker_image(contents, filename):
     return None
 
 @app.callback(
-    Output('mapa', 'src'),
+    [Output('layers-store', 'data'),
+     Output('active-layer-dropdown', 'options'),
+     Output('active-layer-dropdown', 'value'),
+     Output('map-error', 'children'),
+     Output('map-error', 'is_open')],
+    [Input('add-points-button', 'n_clicks'),
+     Input('clear-layers-button', 'n_clicks')],
+    [State('color-marker-picker', 'value'),
+     State('marker-size-slider', 'value'),
+     State('marker-symbol', 'value'),
+     State('uploaded-marker-image-store', 'data'),
+     State('uploaded-data-store', 'data'),
+     State('latitude-column', 'value'),
+     State('longitude-column', 'value'),
+     State('municipio-column', 'value'),
+     State('layer-name-input', 'value'),
+     State('layers-store', 'data')]
+)
+def update_layers(n_clicks, clear_clicks, color_marker, marker_size, marker_style,
+                  marker_image, data, lat_col, lon_col, municipio_col, layer_name, layers):
+    """
+    Adiciona ou remove camadas, com o estilo atual dos controles. As mudanças
+    de estilo de camadas existentes são feitas no navegador (restyleLayer).
+    """
+    ctx = dash.callback_context
+    trigger = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else ''
+    layers = list(layers or [])
+    warning = None
+
+    try:
+        if trigger == 'clear-layers-button':
+            layers = []
+        elif trigger == 'add-points-button':
+            df = pd.DataFrame(data or [])
+            if lat_col in df.columns and lon_col in df.columns:
+                # Vazios, vírgula decimal, graus/minutos, faixa e lat/lon trocadas
+                coords = clean_coordinates(df[lat_col], df[lon_col])
+            elif municipio_col in df.columns:
+                # Nome ou código IBGE do município, resolvido pelo gazetteer local
+                coords = geocode_municipios(df[municipio_col])
+                if coords is None:
+                    return (dash.no_update,) * 3 + ("Localização por município indisponível.", True)
+            else:
+                return (dash.no_update,) * 5
+            warning = coords.message()
+            latitudes, longitudes = coords.valid_points()
+            if len(latitudes) == 0:
+                return (dash.no_update,) * 3 + (warning or "Nenhum ponto válido.", True)
+            layers.append({
+                # Chave da camada nos estilos alterados no navegador (layer-styles)
+                'id': uuid.uuid4().hex,
+                'name': layer_name or f"Camada {len(layers) + 1}",
+                'latitudes': latitudes.tolist(),
+                'longitudes': longitudes.tolist(),
+                'marker_style': marker_style,
+                'color': color_marker or '#f9b347',
+                'size': marker_size or 1.0,
+                'marker_image': marker_image,
+            })
+        else:
+            return (dash.no_update,) * 5
+
+        options = [{'label': layer['name'], 'value': i} for i, layer in enumerate(layers)]
+        # Aviso das linhas descartadas ou corrigidas ao adicionar a camada
+        alert = (warning, True) if warning else (dash.no_update, dash.no_update)
+        # Nenhuma camada ativa: a nova só recebe alterações de estilo se for escolhida
+        return (layers, options, None) + alert
+
+    except Exception as e:
+        logger.error(f"Erro ao atualizar camadas: {e}")
+        return (dash.no_update,) * 5
+
+@app.callback(
+    [Output('mapa', 'src'),
+     Output('map-render-state', 'data')],
     [Input('pais-dropdown', 'value'),
      Input('regiao-dropdown', 'value'),
      Input('uf-dropdown', 'value'),
      Input('municipios-dropdown', 'value'),
-     Input('uploaded-data-store', 'data'),
-     Input('uploaded-marker-image-store', 'data'),
-     Input('add-points-button', 'n_clicks'),
+     Input('layers-render', 'data'),
+     Input('map-style', 'data'),
+     Input('projection-dropdown', 'value')],
+    [State('map-mode', 'value'),
+     State('session-id', 'data')]
+)
+def update_map(pais, region_id, uf_id, municipio_id, layers, map_style, crs, map_mode,
+               session_id):
+    
+    generation = coalescing.begin(session_id)
+    # Sinaliza ao navegador o fim da atualização (remove o preview)
+    render_state = {'generation': generation, 'time': time.time()}
+    if map_mode == 'vetorial':
+        # O mapa vetorial é montado no navegador (update_vector_data)
+        return dash.no_update, render_state
+    try:
+        # Configurações padrão
+        style = map_style or {}
+        color_map_hex = style.get('color_map') or '#044c6d'
+        color_border_hex = style.get('color_border') or '#ffffff'
+        border_thickness = style.get('border_thickness') or 0.5
+        show_axes = style.get('show_axes', False)
+        show_legends = style.get('show_legend', True)
+        show_compass = style.get('show_compass', True)
+
+        # Determinar área
+        if municipio_id:
+            area_type, area_id = 'municipio', municipio_id
+        elif uf_id:
+            area_type, area_id = 'uf', uf_id
+        elif region_id:
+            area_type, area_id = 'region', region_id
+        else:
+            area_type, area_id = 'brasil', None
+
+        ctx = dash.callback_context
+        trigger = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+        metrics.MAP_UPDATES.inc(stage=MAP_INPUT_STAGES.get(trigger, 'area'))
+
+        gdf_area, area_name, error = get_area_map(area_type, area_id)
+        if error:
+            logger.error(f"Falha ao gerar mapa base: {error}")
+            return None, render_state
+
+        # Camadas já filtradas para esta área são reaproveitadas do cache
+        area_key = (area_type, area_id)
+        stack = LayerStack.from_dicts(gdf_area, area_key, layers)
+
+        # Mesma combinação de área, estilo e camadas: a imagem já existe
+        params_key = (area_key, color_map_hex, color_border_hex, border_thickness,
+                      bool(show_axes), bool(show_legends), bool(show_compass),
+                      stack.state_key(), crs)
+        url = cached_image_url(params_key)
+        if url is not None:
+            return url, render_state
+
+        # Só renderiza se nenhuma chamada mais nova da sessão chegou nesse meio tempo
+        if not coalescing.wait_latest(session_id, generation):
+            metrics.COALESCED_UPDATES.inc(stage='window')
+            return dash.no_update, dash.no_update
+
+        image = render_map_image(
+            gdf_area, area_name, stack.visible_layers(),
+            color_map=color_map_hex, color_border=color_border_hex,
+            border_thickness=border_thickness, show_axes=show_axes,
+            show_legend=show_legends, show_compass=show_compass,
+            area_key=area_key, crs=crs,
+            is_stale=lambda: coalescing.is_stale(session_id, generation)
+        )
+        return store_image(image, params_key=params_key), render_state
+
+    except RenderCancelled:
+        metrics.COALESCED_UPDATES.inc(stage='render_slot')
+        return dash.no_update, dash.no_update
+
+    except Exception as e:
+        logger.error(f"Erro ao atualizar mapa: {e}")
+        traceback.print_exc()
+        return None, render_state
+
+# Id da sessão (por aba) usado na coalescência das atualizações do mapa
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='sessionId'),
+    Output('session-id', 'data'),
+    Input('session-id', 'modified_timestamp'),
+    State('session-id', 'data')
+)
+
+# Preview imediato das mudanças de estilo enquanto o mapa é renderizado
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='previewMap'),
+    [Output('mapa', 'style'),
+     Output('map-container', 'className')],
+    [Input('map-render-state', 'data'),
+     Input('color-map-picker', 'value'),
+     Input('color-border-picker', 'value'),
+     Input('border-thickness-slider', 'drag_value'),
+     Input('pais-dropdown', 'value'),
+     Input('regiao-dropdown', 'value'),
+     Input('uf-dropdown', 'value'),
+     Input('municipios-dropdown', 'value'),
+     Input('layers-render', 'data'),
+     Input('projection-dropdown', 'value')],
+    [State('border-thickness-slider', 'value'),
+     State('map-mode', 'value')]
+)
+
+# Estilo do mapa renderizado no servidor; no modo vetorial não muda, e as
+# alterações de estilo não chegam a update_map
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='rasterStyle'),
+    Output('map-style', 'data'),
+    [Input('map-mode', 'value'),
      Input('color-map-picker', 'value'),
      Input('color-border-picker', 'value'),
-     Input('color-marker-picker', 'value'),
-     Input('marker-size-slider', 'value'),
      Input('border-thickness-slider', 'value'),
      Input('toggle-axes', 'value'),
      Input('toggle-legends', 'value'),
-     Input('toggle-compass', 'value')],
-    [State('latitude-column', 'value'),
-     State('longitude-column', 'value'),
-     State('marker-symbol', 'value'),
-     State('layer-name-input', 'value')]
+     Input('toggle-compass', 'value')]
+)
+
+# Estilo das camadas alterado no navegador: só a camada ativa, sem chamada
+# ao servidor
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='restyleLayer'),
+    Output('layer-styles', 'data'),
+    [Input('color-marker-picker', 'value'),
+     Input('marker-size-slider', 'value'),
+     Input('marker-symbol', 'value'),
+     Input('uploaded-marker-image-store', 'data')],
+    [State('active-layer-dropdown', 'value'),
+     State('layers-store', 'data'),
+     State('layer-styles', 'data')],
+    prevent_initial_call=True
 )
-def update_map(pais, region_id, uf_id, municipio_id, data, marker_image, n_clicks,
-               color_map, color_border, color_marker, marker_size, border_thickness,
-               show_axes, show_legends, show_compass, lat_col, lon_col,
-               marker_style, layer_name):
-    
-    try:
-        # Configurações padrão
-        color_map_hex = color_map if color_map else '#044c6d'
-        color_border_hex = color_border if color_border else '#ffffff'
-        border_thickness = border_thickness if border_thickness else 0.5
 
-        # Determinar área e nome
+# Camadas com o estilo do navegador, para o mapa renderizado no servidor; no
+# modo vetorial não mudam, e as mudanças de estilo não chegam a update_map
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='layersRender'),
+    Output('layers-render', 'data'),
+    [Input('map-mode', 'value'),
+     Input('layers-store', 'data'),
+     Input('layer-styles', 'data')]
+)
+
+@app.callback(
+    Output('vector-data', 'data'),
+    [Input('map-mode', 'value'),
+     Input('pais-dropdown', 'value'),
+     Input('regiao-dropdown', 'value'),
+     Input('uf-dropdown', 'value'),
+     Input('municipios-dropdown', 'value'),
+     Input('layers-store', 'data')],
+    State('vector-data', 'data')
+)
+def update_vector_data(map_mode, pais, region_id, uf_id, municipio_id, layers, current):
+    """Contornos e pontos do modo vetorial; o estilo é aplicado no navegador."""
+    if map_mode != 'vetorial':
+        return dash.no_update
+    try:
         if municipio_id:
-            area_name = get_area_name('municipio', municipio_id)
-            map_image, gdf_area = generate_municipio_map(
-                municipio_id, color_map_hex, color_border_hex,
-                border_thickness, show_axes, show_legends, show_compass
-            )
+            area_type, area_id = 'municipio', municipio_id
         elif uf_id:
-            area_name = get_area_name('uf', uf_id)
-            map_image, gdf_area = generate_uf_with_municipios_map(
-                uf_id, color_map_hex, color_border_hex,
-                border_thickness, show_axes, show_legends, show_compass
-            )
+            area_type, area_id = 'uf', uf_id
         elif region_id:
-            area_name = get_area_name('region', region_id)
-            map_image, gdf_area = generate_region_map(
-                region_id, color_map_hex, color_border_hex,
-                border_thickness, show_axes, show_legends, show_compass
-            )
+            area_type, area_id = 'region', region_id
         else:
-            area_name = 'Brasil'
-            map_image, gdf_area = generate_brazil_map(
-                color_map_hex, color_border_hex,
-                border_thickness, show_axes, show_legends, show_compass
-            )
-
-        if map_image is None:
-            logger.error("Falha ao gerar mapa base")
-            return None
+            area_type, area_id = 'brasil', None
 
-        # Se houver dados para adicionar ao mapa
-        if all([data, lat_col, lon_col, gdf_area is not None]):
-            df = pd.DataFrame(data)
-            if lat_col in df.columns and lon_col in df.columns:
-                latitudes = df[lat_col].astype(float)
-                longitudes = df[lon_col].astype(float)
-                
-                filtered_latitudes, filtered_longitudes = filter_points_by_area(
-                    latitudes, longitudes, gdf_area
-                )
-                
-                map_image = add_points_to_map(
-                    gdf_area, filtered_latitudes, filtered_longitudes,
-                    marker_style, color_map_hex, color_border_hex,
-                    color_marker, marker_size, border_thickness,
-                    show_axes, layer_name, marker_image,
-                    area_name, show_legends, show_compass  # Usando area_name aqui
-                )
-
-        return map_image
+        # Mesma área e mesmas camadas: os dados no navegador continuam válidos
+        data_key = [area_type, area_id, *(layer.get('id') for layer in layers or [])]
+        if current and current.get('key') == data_key:
+            return dash.no_update
+
+        gdf_area, area_name, error = get_area_map(area_type, area_id)
+        if error:
+            logger.error(f"Falha ao gerar mapa vetorial: {error}")
+            return dash.no_update
+
+        area_key = (area_type, area_id)
+        stack = LayerStack.from_dicts(gdf_area, area_key, layers)
+
+        payload = vector_payload(gdf_area, area_name, area_key, stack.visible_layers())
+        payload['key'] = data_key
+        return payload
 
     except Exception as e:
-        logger.error(f"Erro ao atualizar mapa: {e}")
+        logger.error(f"Erro ao atualizar mapa vetorial: {e}")
         traceback.print_exc()
-        return None
+        return dash.no_update
+
+# Figura Plotly do modo vetorial, montada e reestilizada no navegador
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='vectorFigure'),
+    Output('mapa-vetorial', 'figure'),
+    [Input('vector-data', 'data'),
+     Input('color-map-picker', 'value'),
+     Input('color-border-picker', 'value'),
+     Input('border-thickness-slider', 'value'),
+     Input('toggle-axes', 'value'),
+     Input('toggle-legends', 'value'),
+     Input('toggle-compass', 'value'),
+     Input('layers-store', 'data'),
+     Input('layer-styles', 'data')]
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace='pymaps', function_name='mapMode'),
+    [Output('map-container', 'style'),
+     Output('mapa-vetorial', 'style')],
+    Input('map-mode', 'value')
+)
 
 @app.callback(
     Output("download-map", "data"),
@@ -217,9 +458,11 @@ def download_map(n_clicks, src):
         return None
     
     try:
-        img_data = src.split(',')[1]
+        content = load_image(src)
+        if content is None:
+            return None
         return dict(
-            content=img_data,
+            content=base64.b64encode(content).decode('ascii'),
             filename="mapa.png",
             type="image/png",
             base64=True
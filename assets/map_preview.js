@@ -0,0 +1,80 @@
+// map_preview.js
+
+// Funções dos callbacks clientside do Dash (namespace "pymaps").
+// Enquanto o servidor renderiza o mapa, a imagem atual recebe um preview
+// barato (filtro CSS) e o contêiner mostra o indicador de carregamento;
+// tudo é removido quando update_map sinaliza o fim em map-render-state.
+
+(function() {
+    // Estilo com que a imagem exibida foi renderizada
+    const rendered = {colorMap: null};
+
+    function hexToHue(hex) {
+        const value = parseInt(hex.slice(1), 16);
+        const r = (value >> 16 & 255) / 255;
+        const g = (value >> 8 & 255) / 255;
+        const b = (value & 255) / 255;
+        const max = Math.max(r, g, b);
+        const delta = max - Math.min(r, g, b);
+        if (delta === 0) {
+            return 0;
+        }
+        let hue;
+        if (max === r) {
+            hue = ((g - b) / delta) % 6;
+        } else if (max === g) {
+            hue = (b - r) / delta + 2;
+        } else {
+            hue = (r - g) / delta + 4;
+        }
+        return hue * 60;
+    }
+
+    function triggeredIds() {
+        const context = window.dash_clientside.callback_context;
+        return (context.triggered || []).map(function(t) {
+            return t.prop_id.split('.')[0];
+        });
+    }
+
+    function sessionId(timestamp, current) {
+        if (current) {
+            return window.dash_clientside.no_update;
+        }
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    function previewMap(renderState, colorMap, colorBorder, borderDrag, pais, regiao, uf,
+                        municipios, layers, projection, borderValue, mapMode) {
+        const triggered = triggeredIds();
+
+        // No modo vetorial não há imagem a pré-visualizar
+        if (mapMode === 'vetorial' || triggered.indexOf('map-render-state') !== -1) {
+            rendered.colorMap = colorMap;
+            return [{}, 'map-container'];
+        }
+
+        // Arrastar o slider e voltar ao valor atual não gera renderização:
+        // desfaz a pré-visualização dos eventos anteriores do arraste
+        if (triggered.length === 1 && triggered[0] === 'border-thickness-slider' &&
+                borderDrag === borderValue) {
+            return [{}, 'map-container'];
+        }
+
+        const style = {transition: 'filter 0.15s ease-in-out'};
+        if (rendered.colorMap && colorMap && colorMap !== rendered.colorMap) {
+            const rotation = hexToHue(colorMap) - hexToHue(rendered.colorMap);
+            style.filter = 'hue-rotate(' + Math.round(rotation) + 'deg)';
+        }
+        return [style, 'map-container map-pending'];
+    }
+
+    window.dash_clientside = window.dash_clientside || {};
+    window.dash_clientside.pymaps = Object.assign({}, window.dash_clientside.pymaps, {
+        sessionId: sessionId,
+        previewMap: previewMap
+    });
+})();
@@ -0,0 +1,160 @@
+// map_vector.js
+
+// Modo vetorial do mapa (namespace "pymaps"): a figura Plotly é montada no
+// navegador a partir dos contornos e pontos enviados pelo servidor
+// (vector-data). Cores, bordas, marcadores, eixos, legenda e rosa dos
+// ventos são aplicados aqui, sem chamada ao servidor.
+//
+// O estilo das camadas existentes também é alterado aqui: layer-styles
+// guarda as alterações por id da camada, sobre o estilo de layers-store.
+// Só no modo imagem as camadas estilizadas seguem para o servidor
+// (layers-render).
+
+(function() {
+    // Símbolos do matplotlib usados no app e seus equivalentes no Plotly
+    const SYMBOLS = {'o': 'circle', 's': 'square', '^': 'triangle-up', 'D': 'diamond',
+                     '*': 'star'};
+
+    // Controle de estilo e campo da camada que ele altera
+    const STYLE_INPUTS = {
+        'color-marker-picker': 'color',
+        'marker-size-slider': 'size',
+        'marker-symbol': 'marker_style',
+        'uploaded-marker-image-store': 'marker_image'
+    };
+
+    function styledLayers(layers, styles) {
+        return (layers || []).map(function(layer) {
+            return Object.assign({}, layer, (styles || {})[layer.id]);
+        });
+    }
+
+    function restyleLayer(color, size, symbol, markerImage, active, layers, styles) {
+        const layer = (layers || [])[active];
+        if (active === null || active === undefined || !layer) {
+            return window.dash_clientside.no_update;
+        }
+        const values = {color: color, size: size, marker_style: symbol,
+                        marker_image: markerImage};
+        const context = window.dash_clientside.callback_context;
+        const changed = {};
+        (context.triggered || []).forEach(function(t) {
+            const field = STYLE_INPUTS[t.prop_id.split('.')[0]];
+            if (field) {
+                changed[field] = values[field];
+            }
+        });
+        if (Object.keys(changed).length === 0) {
+            return window.dash_clientside.no_update;
+        }
+
+        // Descarta os estilos de camadas já removidas
+        const result = {};
+        layers.forEach(function(l) {
+            if ((styles || {})[l.id]) {
+                result[l.id] = styles[l.id];
+            }
+        });
+        result[layer.id] = Object.assign({}, result[layer.id], changed);
+        return result;
+    }
+
+    function layersRender(mode, layers, styles) {
+        if (mode === 'vetorial') {
+            return window.dash_clientside.no_update;
+        }
+        return styledLayers(layers, styles);
+    }
+
+    function rasterStyle(mode, colorMap, colorBorder, borderThickness, showAxes,
+                         showLegend, showCompass) {
+        if (mode === 'vetorial') {
+            return window.dash_clientside.no_update;
+        }
+        return {
+            color_map: colorMap,
+            color_border: colorBorder,
+            border_thickness: borderThickness,
+            show_axes: showAxes,
+            show_legend: showLegend,
+            show_compass: showCompass
+        };
+    }
+
+    function vectorFigure(data, colorMap, colorBorder, borderThickness, showAxes,
+                          showLegend, showCompass, layers, styles) {
+        if (!data) {
+            return window.dash_clientside.no_update;
+        }
+        layers = styledLayers(layers, styles);
+        const boundary = data.boundary;
+        const traces = [{
+            type: 'scatter',
+            mode: 'lines',
+            x: boundary.x,
+            y: boundary.y,
+            fill: 'toself',
+            fillcolor: colorMap || '#044c6d',
+            line: {color: colorBorder || '#ffffff', width: borderThickness || 0},
+            name: data.area_name,
+            hoverinfo: 'skip'
+        }];
+
+        // Estilo de cada camada (layers-store e layer-styles), na mesma ordem dos pontos
+        (data.layers || []).forEach(function(layer, i) {
+            const style = (layers || [])[i] || {};
+            traces.push({
+                type: 'scattergl',
+                mode: 'markers',
+                x: layer.x,
+                y: layer.y,
+                name: style.name || layer.name,
+                marker: {
+                    color: style.color || '#f9b347',
+                    size: 8 * (style.size || 1),
+                    symbol: SYMBOLS[style.marker_style] || 'circle'
+                },
+                hovertemplate: '%{y:.5f}, %{x:.5f}<extra></extra>'
+            });
+        });
+
+        // Graus de longitude encolhem com a latitude: mantém a proporção do mapa
+        const bounds = boundary.bounds;
+        const midLat = (bounds[1] + bounds[3]) / 2 * Math.PI / 180;
+        const axis = {visible: !!showAxes, showgrid: false, zeroline: false};
+        const layout = {
+            title: {text: data.area_name},
+            showlegend: !!showLegend,
+            legend: {x: 0, y: 0, bgcolor: 'rgba(255, 255, 255, 0.8)'},
+            xaxis: Object.assign({range: [bounds[0], bounds[2]]}, axis),
+            yaxis: Object.assign({range: [bounds[1], bounds[3]], scaleanchor: 'x',
+                                  scaleratio: 1 / Math.cos(midLat)}, axis),
+            margin: {l: 10, r: 10, t: 40, b: 10},
+            plot_bgcolor: 'white',
+            // Mantém o zoom do usuário ao trocar cores e opções
+            uirevision: data.area_name,
+            images: showCompass ? [{
+                source: 'assets/compass_rose.png',
+                xref: 'paper', yref: 'paper', x: 1, y: 1,
+                sizex: 0.12, sizey: 0.12, xanchor: 'right', yanchor: 'top'
+            }] : []
+        };
+        return {data: traces, layout: layout};
+    }
+
+    function mapMode(mode) {
+        if (mode === 'vetorial') {
+            return [{display: 'none'}, {height: '70vh'}];
+        }
+        return [{}, {display: 'none'}];
+    }
+
+    window.dash_clientside = window.dash_clientside || {};
+    window.dash_clientside.pymaps = Object.assign({}, window.dash_clientside.pymaps, {
+        restyleLayer: restyleLayer,
+        layersRender: layersRender,
+        rasterStyle: rasterStyle,
+        vectorFigure: vectorFigure,
+        mapMode: mapMode
+    });
+})();
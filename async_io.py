@@ -0,0 +1,149 @@
+"""
+E/S assíncrona com a API do IBGE.
+
+As requisições de localidades e malhas rodam em um único event loop asyncio,
+numa thread própria de cada processo. As threads dos callbacks apenas
+aguardam o resultado, sem segurar sockets, de modo que esperar pelo IBGE
+não ocupa as vagas de renderização (rendering.render_context), que
+continuam limitando o trabalho de CPU em cada worker do gunicorn.
+
+- O cliente é o aiohttp, se instalado. Sem ele, o requests roda no executor
+  do loop, com os mesmos limites.
+- No máximo UPSTREAM_CONCURRENCY requisições ficam abertas ao mesmo tempo.
+- Pedidos simultâneos da mesma URL compartilham uma única requisição.
+
+O loop é criado no primeiro uso e recriado se o processo mudou (fork do
+gunicorn com --preload), já que threads não sobrevivem ao fork.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from metrics import COALESCED_FETCHES, observe_upstream
+
+try:
+    import aiohttp
+except ImportError:  # Dependência opcional
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# Requisições simultâneas ao IBGE por processo
+UPSTREAM_CONCURRENCY = int(os.environ.get('PYMAPS_UPSTREAM_CONCURRENCY', 16))
+
+# Tempo limite padrão das requisições (segundos)
+UPSTREAM_TIMEOUT = float(os.environ.get('PYMAPS_UPSTREAM_TIMEOUT', 30))
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {'pid': None, 'loop': None, 'io': None}
+
+class _LoopState:
+    """
+    Objetos que só podem ser usados de dentro do loop. É criado já na
+    thread do loop: até o Python 3.9, o Semaphore se prende ao loop da
+    thread em que é construído.
+    """
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.session = None
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop de E/S do processo, iniciado no primeiro uso."""
+    pid = os.getpid()
+    if _state['pid'] == pid:
+        return _state['loop']
+    with _lock:
+        if _state['pid'] != pid:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_run_loop, args=(loop,),
+                                      name='pymaps-io', daemon=True)
+            thread.start()
+            _state['loop'] = loop
+            _state['io'] = None
+            _state['pid'] = pid
+        return _state['loop']
+
+def _blocking_get(url: str, timeout: float) -> Tuple[Any, Optional[Any]]:
+    response = requests.get(url, timeout=timeout)
+    return response.status_code, response.json() if response.status_code == 200 else None
+
+def _loop_state() -> _LoopState:
+    """Estado do loop, criado na primeira corrotina (só a thread do loop o acessa)."""
+    state = _state['io']
+    if state is None:
+        state = _state['io'] = _LoopState()
+    return state
+
+async def _request(state: _LoopState, url: str, timeout: float) -> Tuple[Any, Optional[Any]]:
+    """Uma requisição ao IBGE, dentro do limite de concorrência."""
+    async with state.semaphore:
+        start = time.perf_counter()
+        status = 'erro'
+        try:
+            if aiohttp is not None:
+                if state.session is None:
+                    state.session = aiohttp.ClientSession()
+                client_timeout = aiohttp.ClientTimeout(total=timeout)
+                async with state.session.get(url, timeout=client_timeout) as response:
+                    status = response.status
+                    # O IBGE nem sempre responde com o content-type de JSON
+                    data = await response.json(content_type=None) if status == 200 else None
+            else:
+                loop = asyncio.get_running_loop()
+                status, data = await loop.run_in_executor(None, _blocking_get, url, timeout)
+            return status, data
+        except Exception as e:
+            logger.error(f"Erro ao acessar {url}: {e}")
+            return status, None
+        finally:
+            observe_upstream(url, time.perf_counter() - start, status)
+
+async def fetch_json_async(url: str, timeout: float = UPSTREAM_TIMEOUT) -> Tuple[Any, Optional[Any]]:
+    """
+    (status, JSON) da URL; pedidos simultâneos da mesma URL são coalescidos.
+    Deve rodar no loop de get_loop().
+    """
+    state = _loop_state()
+    future = state.in_flight.get(url)
+    if future is not None:
+        COALESCED_FETCHES.inc()
+        return await asyncio.shield(future)
+
+    future = asyncio.ensure_future(_request(state, url, timeout))
+    state.in_flight[url] = future
+    future.add_done_callback(lambda _: state.in_flight.pop(url, None))
+    return await asyncio.shield(future)
+
+def _wait(coroutine, timeout: float):
+    """Executa a corrotina no loop de E/S e aguarda o resultado nesta thread."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop()).result(timeout)
+
+def fetch_json(url: str, timeout: float = UPSTREAM_TIMEOUT) -> Tuple[Any, Optional[Any]]:
+    """Versão síncrona de fetch_json_async, para os callbacks do Dash."""
+    try:
+        # Margem para a fila do semáforo além do tempo da própria requisição
+        return _wait(fetch_json_async(url, timeout), timeout * 2)
+    except Exception as e:
+        logger.error(f"Erro ao aguardar {url}: {e}")
+        return 'erro', None
+
+def fetch_many(urls: Sequence[str], timeout: float = UPSTREAM_TIMEOUT) -> List[Tuple[Any, Optional[Any]]]:
+    """Busca várias URLs em paralelo; o resultado segue a ordem de urls."""
+    async def gather():
+        return await asyncio.gather(*(fetch_json_async(url, timeout) for url in urls))
+    try:
+        return _wait(gather(), timeout * 2)
+    except Exception as e:
+        logger.error(f"Erro ao aguardar {len(urls)} requisições: {e}")
+        return [('erro', None)] * len(urls)
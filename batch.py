@@ -0,0 +1,319 @@
+"""
+Renderização de mapas em lote, fora do Dash.
+
+Lê um manifesto (JSON ou JSON Lines) com um job por mapa e grava os
+arquivos PNG/SVG diretamente no diretório de saída. Jobs com format 'mp4',
+'gif' ou 'frames' e uma coluna de data (date_col) geram animações dos
+pontos por período (animation.py). Jobs com "panels": "uf" geram uma
+grade com um painel por UF da região (ou do Brasil), com legenda única
+(small_multiples.py). Os jobs são
+distribuídos em um pool de processos, agrupados por área para que cada
+processo reaproveite o cache de malhas (MALHA_CACHE).
+
+Uso:
+    python batch.py manifesto.json --saida mapas/ --processos 4
+
+Exemplo de manifesto:
+    {
+        "defaults": {"color_map": "#044c6d", "format": "png"},
+        "jobs": [
+            {"area_type": "uf", "area_id": 35, "data": "dados.csv",
+             "lat_col": "lat", "lon_col": "lon", "output": "sp.png"},
+            {"area_type": "brasil", "data": "vendas.csv",
+             "municipio_col": "municipio", "output": "vendas.png"},
+            {"area_type": "uf", "area_id": 35, "data": "dados.csv",
+             "lat_col": "lat", "lon_col": "lon", "date_col": "data",
+             "time_bucket": "W", "format": "gif", "output": "sp_semanal.gif"},
+            {"area_type": "region", "area_id": 2, "data": "dados.csv",
+             "lat_col": "lat", "lon_col": "lon", "panels": "uf",
+             "output": "nordeste_ufs.png"}
+        ]
+    }
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from map_utils import (
+    PointLayer, base_map_key, get_area_map, build_map_figure, map_layout_key,
+    points_in_area, save_fig_to_file
+)
+from animation import ANIMATION_FORMATS, render_animation
+from small_multiples import render_small_multiples
+from rendering import render_context
+from coordinates import clean_coordinates
+from gazetteer import geocode_municipios
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Valores padrão de um job (mesmos padrões da interface)
+JOB_DEFAULTS = {
+    'area_type': 'brasil',
+    'area_id': None,
+    'format': 'png',
+    'data': None,
+    'lat_col': None,
+    'lon_col': None,
+    'municipio_col': None,
+    'marker_style': 'o',
+    'marker_image': None,
+    'layer_name': 'Pontos',
+    'color_map': '#044c6d',
+    'color_border': '#ffffff',
+    'color_marker': '#f9b347',
+    'marker_size': 1.0,
+    'border_thickness': 0.5,
+    'show_axes': False,
+    'show_legend': True,
+    'show_compass': True,
+    'crs': None,
+    # Animação (format 'mp4', 'gif' ou 'frames'): coluna de data e período dos quadros
+    'date_col': None,
+    'time_bucket': 'M',
+    'fps': 4,
+    'cumulative': False,
+    # Pequenos múltiplos ('uf': um painel por UF da área), em PNG
+    'panels': None,
+    'panel_columns': None,
+    'panel_processes': None,
+}
+
+def load_manifest(path: str) -> List[Dict]:
+    """Carrega o manifesto e aplica os valores padrão a cada job."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            manifest = {'jobs': [json.loads(line) for line in f if line.strip()]}
+        else:
+            manifest = json.load(f)
+
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+
+    # Caminhos relativos são resolvidos a partir do diretório do manifesto
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = {**JOB_DEFAULTS, **manifest.get('defaults', {})}
+    jobs = []
+    for job in manifest.get('jobs', []):
+        job = {**defaults, **job}
+        for key in ('data', 'marker_image'):
+            if job[key] and not os.path.isabs(job[key]):
+                job[key] = os.path.join(base_dir, job[key])
+        if not job.get('output'):
+            suffix = f"_{job['area_id']}" if job['area_id'] is not None else ''
+            job['output'] = f"{job['area_type']}{suffix}.{job['format']}"
+        jobs.append(job)
+    return jobs
+
+@lru_cache(maxsize=8)
+def load_dataset(path: str) -> pd.DataFrame:
+    """Carrega um conjunto de dados uma única vez por processo."""
+    if path.lower().endswith(('.xls', '.xlsx')):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+@lru_cache(maxsize=8)
+def load_marker_image(path: str) -> str:
+    """Converte a imagem do marcador em data URI, como no upload do Dash."""
+    with open(path, 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode('ascii')
+    return f'data:image/png;base64,{encoded}'
+
+def load_job_points(job: Dict):
+    """Coordenadas limpas do job e o conjunto de dados (None, None sem pontos)."""
+    if not job['data'] or not ((job['lat_col'] and job['lon_col']) or job['municipio_col']):
+        return None, None
+    df = load_dataset(job['data'])
+    if job['lat_col'] and job['lon_col']:
+        return clean_coordinates(df[job['lat_col']], df[job['lon_col']]), df
+    coords = geocode_municipios(df[job['municipio_col']])
+    if coords is None:
+        raise RuntimeError("Gazetteer de municípios indisponível")
+    return coords, df
+
+def _render_panels_job(job: Dict, output_dir: str, report: Dict, start: float) -> Dict:
+    """Job de pequenos múltiplos: um painel por UF, numa única imagem PNG."""
+    if job['panels'] != 'uf':
+        raise ValueError(f"Painéis não suportados: {job['panels']}")
+    if job['format'] != 'png':
+        raise ValueError("Pequenos múltiplos são gerados apenas em PNG")
+
+    latitudes = longitudes = None
+    coords, _ = load_job_points(job)
+    if coords is not None:
+        report['rows'] = coords.summary()
+        latitudes, longitudes = coords.valid_points()
+
+    content, timings = render_small_multiples(
+        job['area_type'], job['area_id'], latitudes, longitudes,
+        layer_name=job['layer_name'], marker_style=job['marker_style'],
+        color_marker=job['color_marker'], marker_size=job['marker_size'],
+        color_map=job['color_map'], color_border=job['color_border'],
+        border_thickness=job['border_thickness'], columns=job['panel_columns'],
+        processes=job['panel_processes'], crs=job['crs']
+    )
+    report.update(timings)
+
+    path = os.path.join(output_dir, job['output'])
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    step = time.perf_counter()
+    with open(path, 'wb') as f:
+        f.write(content)
+    report['save_s'] = time.perf_counter() - step
+    report['total_s'] = time.perf_counter() - start
+    return report
+
+def render_job(job: Dict, output_dir: str) -> Dict:
+    """Renderiza um job e retorna o relatório com os tempos de cada etapa."""
+    report = {'output': job['output'], 'status': 'ok', 'error': None}
+    start = time.perf_counter()
+    try:
+        if job['panels']:
+            return _render_panels_job(job, output_dir, report, start)
+
+        area_key = (job['area_type'], job['area_id'])
+        gdf_area, area_name, error = get_area_map(*area_key)
+        if error:
+            raise RuntimeError(error)
+        report['fetch_s'] = time.perf_counter() - start
+
+        latitudes = longitudes = dates = None
+        step = time.perf_counter()
+        coords, df = load_job_points(job)
+        if coords is not None:
+            report['rows'] = coords.summary()
+            latitudes, longitudes = coords.valid_points()
+            inside = points_in_area(latitudes, longitudes, gdf_area, area_key)
+            latitudes, longitudes = latitudes[inside], longitudes[inside]
+            if job['date_col']:
+                dates = df[job['date_col']].to_numpy()[coords.valid][inside]
+            report['points'] = int(len(latitudes))
+            report['filter_s'] = time.perf_counter() - step
+
+        path = os.path.join(output_dir, job['output'])
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        if job['format'] in ANIMATION_FORMATS:
+            if dates is None:
+                raise RuntimeError("Animação requer pontos e a coluna de data (date_col)")
+            # Base e legenda desenhadas uma vez; só os marcadores mudam por quadro
+            step = time.perf_counter()
+            report.update(render_animation(
+                gdf_area, area_name, latitudes, longitudes, dates, path, job['format'],
+                freq=job['time_bucket'], fps=job['fps'], cumulative=job['cumulative'],
+                layer_name=job['layer_name'], marker_style=job['marker_style'],
+                color_marker=job['color_marker'], marker_size=job['marker_size'],
+                color_map=job['color_map'], color_border=job['color_border'],
+                border_thickness=job['border_thickness'], show_axes=job['show_axes'],
+                show_legend=job['show_legend'], show_compass=job['show_compass'],
+                area_key=area_key, crs=job['crs']
+            ))
+            report['render_s'] = time.perf_counter() - step
+        else:
+            marker_image = load_marker_image(job['marker_image']) if job['marker_image'] else None
+            layers = [] if latitudes is None else [
+                PointLayer(job['layer_name'], [], [], marker_image=marker_image)
+            ]
+            extent_key = map_layout_key(gdf_area, area_name, job['show_axes'],
+                                        job['show_legend'], job['show_compass'],
+                                        job['border_thickness'], layers, job['crs'])
+
+            # Jobs seguidos da mesma área e estilo reaproveitam a malha desenhada
+            base_key = base_map_key(area_key, job['color_map'], job['color_border'],
+                                    job['border_thickness'], job['crs'])
+            with render_context(job['show_axes'], job['show_legend'],
+                                job['show_compass'], base_key) as template:
+                step = time.perf_counter()
+                fig = build_map_figure(
+                    gdf_area, area_name, latitudes, longitudes,
+                    job['marker_style'], job['color_map'], job['color_border'],
+                    job['color_marker'], job['marker_size'], job['border_thickness'],
+                    job['show_axes'], job['layer_name'], marker_image,
+                    job['show_legend'], job['show_compass'], template=template,
+                    base_key=base_key, crs=job['crs'], area_key=area_key
+                )
+                if fig is None:
+                    raise RuntimeError("Falha ao gerar figura")
+                report['render_s'] = time.perf_counter() - step
+
+                step = time.perf_counter()
+                report['bytes'] = save_fig_to_file(fig, path, job['format'], extent_key)
+                report['save_s'] = time.perf_counter() - step
+
+    except Exception as e:
+        logger.error(f"Erro no job {job['output']}: {str(e)}")
+        traceback.print_exc()
+        report['status'] = 'erro'
+        report['error'] = str(e)
+
+    report['total_s'] = time.perf_counter() - start
+    return report
+
+def _render_job_args(args):
+    return render_job(*args)
+
+def run_batch(jobs: List[Dict], output_dir: str,
+              processes: Optional[int] = None) -> List[Dict]:
+    """
+    Executa os jobs em um pool de processos e retorna os relatórios na
+    ordem original do manifesto.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Ordena por área para que jobs da mesma malha caiam no mesmo lote
+    order = sorted(range(len(jobs)),
+                   key=lambda i: (jobs[i]['area_type'], str(jobs[i]['area_id'])))
+    args = [(jobs[i], output_dir) for i in order]
+
+    if processes == 1 or len(jobs) <= 1:
+        results = [_render_job_args(a) for a in args]
+    else:
+        processes = processes or os.cpu_count() or 1
+        chunksize = max(1, len(args) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_render_job_args, args, chunksize=chunksize))
+
+    reports = [None] * len(jobs)
+    for i, result in zip(order, results):
+        reports[i] = result
+    return reports
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gera mapas em lote a partir de um manifesto.")
+    parser.add_argument('manifesto', help="Arquivo JSON ou JSON Lines com os jobs")
+    parser.add_argument('--saida', default='mapas', help="Diretório de saída")
+    parser.add_argument('--processos', type=int, default=None,
+                        help="Número de processos (padrão: número de CPUs)")
+    parser.add_argument('--relatorio', default=None,
+                        help="Arquivo JSON do relatório (padrão: <saida>/relatorio.json)")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifesto)
+    logger.info(f"Executando {len(jobs)} jobs")
+    start = time.perf_counter()
+    reports = run_batch(jobs, args.saida, args.processos)
+    elapsed = time.perf_counter() - start
+
+    report_path = args.relatorio or os.path.join(args.saida, 'relatorio.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(reports, f, indent=2, ensure_ascii=False)
+
+    failed = sum(1 for r in reports if r['status'] != 'ok')
+    logger.info(f"{len(jobs) - failed} mapas gerados, {failed} falhas em {elapsed:.1f} s. "
+                f"Relatório: {report_path}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
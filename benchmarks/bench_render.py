@@ -0,0 +1,220 @@
+"""
+Benchmarks do caminho de renderização (geração do mapa base, filtro de
+pontos e adição de pontos), rodando sem rede contra as fixtures gravadas.
+
+Cada caso roda em um processo novo, de modo que o pico de RSS medido é o
+do próprio caso. Os resultados são comparados com o baseline salvo e o
+script termina com código 1 se algum caso regredir além da tolerância.
+
+Uso:
+    python benchmarks/bench_render.py                      # roda e compara
+    python benchmarks/bench_render.py --salvar-baseline    # grava o baseline
+    python benchmarks/bench_render.py --casos "uf.*scatter" --max-pontos 1000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+sys.path.insert(0, BENCH_DIR)
+from ibge_stub import FIXTURES_DIR, fixtures_id, start_stub_server  # noqa: E402
+from record_fixtures import REGION_ID, UF_ID, MUNICIPIO_ID  # noqa: E402
+
+AREAS = [('brasil', None), ('region', REGION_ID), ('uf', UF_ID), ('municipio', MUNICIPIO_ID)]
+POINT_COUNTS = [10, 1_000, 100_000, 1_000_000]
+# Marcadores de imagem criam um artista por ponto: limitados a contagens menores
+MAX_IMAGE_POINTS = 1_000
+TOGGLES = [(True, True), (False, False)]  # (legenda, rosa dos ventos)
+
+# Métricas comparadas com o baseline
+METRICS = ('wall_s', 'peak_rss_mb', 'output_bytes')
+
+def build_cases(max_points=None):
+    cases = []
+    for area_type, area_id in AREAS:
+        area = area_type if area_id is None else f"{area_type}-{area_id}"
+        for legend, compass in TOGGLES:
+            cases.append({'id': f"generate/{area}/legenda={legend}/rosa={compass}",
+                          'op': 'generate', 'area_type': area_type, 'area_id': area_id,
+                          'legend': legend, 'compass': compass})
+        for n in POINT_COUNTS:
+            if max_points and n > max_points:
+                continue
+            cases.append({'id': f"filter/{area}/n={n}", 'op': 'filter',
+                          'area_type': area_type, 'area_id': area_id, 'points': n})
+            for marker in ('scatter', 'imagem'):
+                if marker == 'imagem' and n > MAX_IMAGE_POINTS:
+                    continue
+                for legend, compass in TOGGLES:
+                    cases.append({
+                        'id': f"add_points/{area}/n={n}/{marker}/legenda={legend}/rosa={compass}",
+                        'op': 'add_points', 'area_type': area_type, 'area_id': area_id,
+                        'points': n, 'marker': marker, 'legend': legend, 'compass': compass,
+                    })
+    return cases
+
+def _marker_image():
+    """Ícone de marcador como no upload do app (reduzido para 32x32)."""
+    import base64
+    from map_utils import optimize_marker_image
+    with open(os.path.join(REPO_DIR, 'assets', 'compass_rose.png'), 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode('ascii')
+    return optimize_marker_image(f'data:image/png;base64,{encoded}')
+
+def _random_points(gdf, n, seed=42):
+    """Pontos uniformes no retângulo envolvente da área (parte cai fora dela)."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = gdf.total_bounds
+    return rng.uniform(miny, maxy, n), rng.uniform(minx, maxx, n)
+
+def _run_case(case, queue):
+    """Executa um caso em um processo novo e envia o resultado pela fila."""
+    sys.path.insert(0, REPO_DIR)
+    import map_utils
+
+    result = {'id': case['id']}
+    try:
+        start = time.perf_counter()
+        gdf, area_name, error = map_utils.get_area_map(case['area_type'], case['area_id'])
+        if error:
+            raise RuntimeError(error)
+        result['fetch_s'] = time.perf_counter() - start
+
+        if case['op'] == 'generate':
+            generate = {
+                'brasil': lambda **kw: map_utils.generate_brazil_map(**kw),
+                'region': lambda **kw: map_utils.generate_region_map(case['area_id'], **kw),
+                'uf': lambda **kw: map_utils.generate_uf_with_municipios_map(case['area_id'], **kw),
+                'municipio': lambda **kw: map_utils.generate_municipio_map(case['area_id'], **kw),
+            }[case['area_type']]
+            start = time.perf_counter()
+            output, _ = generate(show_legend=case['legend'], show_compass=case['compass'])
+            result['wall_s'] = time.perf_counter() - start
+            result['output_bytes'] = len(output or '')
+        else:
+            latitudes, longitudes = _random_points(gdf, case['points'])
+            start = time.perf_counter()
+            latitudes, longitudes = map_utils.filter_points_by_area(latitudes, longitudes, gdf)
+            if case['op'] == 'filter':
+                result['wall_s'] = time.perf_counter() - start
+                result['output_bytes'] = 0
+            else:
+                marker_image = _marker_image() if case['marker'] == 'imagem' else None
+                start = time.perf_counter()
+                output = map_utils.add_points_to_map(
+                    gdf, latitudes, longitudes, 'o', marker_image=marker_image,
+                    area_name=area_name, show_legend=case['legend'],
+                    show_compass=case['compass']
+                )
+                result['wall_s'] = time.perf_counter() - start
+                result['output_bytes'] = len(output or '')
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'erro'
+        result['error'] = str(e)
+
+    # ru_maxrss é em KB no Linux
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put(result)
+
+def run_case(case, base_url, timeout):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    os.environ['IBGE_API_URL'] = base_url
+    process = ctx.Process(target=_run_case, args=(case, queue))
+    process.start()
+    try:
+        result = queue.get(timeout=timeout)
+    except Exception:
+        process.kill()
+        result = {'id': case['id'], 'status': 'erro', 'error': 'timeout'}
+    process.join()
+    return result
+
+def compare(results, baseline, tolerance):
+    """Retorna a lista de regressões em relação ao baseline."""
+    regressions = []
+    for result in results:
+        reference = baseline.get('results', {}).get(result['id'])
+        if not reference or result.get('status') != 'ok':
+            continue
+        for metric in METRICS:
+            old, new = reference.get(metric), result.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append((result['id'], metric, old, new))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de renderização do PyMaps.")
+    parser.add_argument('--casos', default=None, help="Regex para filtrar os casos pelo id")
+    parser.add_argument('--max-pontos', type=int, default=None,
+                        help="Ignora casos com mais pontos que este limite")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--salvar-baseline', action='store_true',
+                        help="Grava os resultados como novo baseline")
+    parser.add_argument('--tolerancia', type=float, default=0.20,
+                        help="Aumento relativo aceito antes de acusar regressão (padrão: 0.20)")
+    parser.add_argument('--timeout', type=float, default=900, help="Tempo máximo por caso (s)")
+    parser.add_argument('--saida', default=None, help="Grava os resultados em JSON")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.max_pontos)
+    if args.casos:
+        cases = [c for c in cases if re.search(args.casos, c['id'])]
+
+    server, base_url = start_stub_server(args.fixtures)
+    current_fixtures = fixtures_id(args.fixtures)
+    results = []
+    try:
+        for case in cases:
+            result = run_case(case, base_url, args.timeout)
+            results.append(result)
+            if result['status'] == 'ok':
+                print(f"{result['id']:<70} {result['wall_s']:>9.3f} s "
+                      f"{result['peak_rss_mb']:>8.1f} MB {result['output_bytes']:>10} B")
+            else:
+                print(f"{result['id']:<70} ERRO: {result.get('error')}")
+    finally:
+        server.shutdown()
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'fixtures': current_fixtures, 'results': results}, f, indent=2)
+
+    if args.salvar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'fixtures': current_fixtures,
+                       'results': {r['id']: r for r in results if r['status'] == 'ok'}},
+                      f, indent=2)
+        print(f"Baseline gravado em {args.baseline}")
+        return 0
+
+    failed = [r for r in results if r['status'] != 'ok']
+    if not os.path.exists(args.baseline):
+        print("Sem baseline para comparar (use --salvar-baseline).")
+        return 1 if failed else 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('fixtures') != current_fixtures:
+        print(f"Baseline gravado com outras fixtures ({baseline.get('fixtures')}); "
+              "comparação ignorada.")
+        return 1 if failed else 0
+
+    regressions = compare(results, baseline, args.tolerancia)
+    for case_id, metric, old, new in regressions:
+        print(f"REGRESSÃO {case_id}: {metric} {old:.3f} -> {new:.3f} ({new / old - 1:+.0%})")
+    return 1 if regressions or failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
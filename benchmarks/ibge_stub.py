@@ -0,0 +1,125 @@
+"""
+Servidor HTTP local que substitui a API do IBGE, servindo respostas
+gravadas em benchmarks/fixtures.
+
+O índice (fixtures/index.json) associa o caminho da requisição, relativo à
+URL base da API (p.ex. "/v1/localidades/estados"), ao arquivo .json.gz com
+a resposta. Para apontar o app para o servidor local:
+
+    IBGE_API_URL=http://127.0.0.1:8765 python app.py
+
+Para os testes de carga, cada resposta pode ser atrasada (latência fixa
+mais uma variação aleatória) e uma fração delas pode falhar com 503.
+
+Uso:
+    python benchmarks/ibge_stub.py --porta 8765
+    python benchmarks/ibge_stub.py --latencia 0.3 --variacao 0.2 --erros 0.05
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    """Carrega o índice e as respostas gravadas (comprimidas em gzip)."""
+    index_path = os.path.join(fixtures_dir, 'index.json')
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(
+            f"Fixtures não encontradas em {fixtures_dir}. "
+            "Grave-as com: python benchmarks/record_fixtures.py"
+        )
+    with open(index_path, encoding='utf-8') as f:
+        index = json.load(f)
+
+    responses = {}
+    for path, filename in index['responses'].items():
+        with open(os.path.join(fixtures_dir, filename), 'rb') as f:
+            responses[path] = f.read()
+    return index, responses
+
+def fixtures_id(fixtures_dir=FIXTURES_DIR):
+    """Identificador do conjunto de fixtures, usado para validar o baseline."""
+    index, responses = load_fixtures(fixtures_dir)
+    digest = hashlib.sha1()
+    for path in sorted(responses):
+        digest.update(path.encode('utf-8'))
+        digest.update(responses[path])
+    return f"{index.get('source', 'desconhecida')}:{digest.hexdigest()[:12]}"
+
+def make_handler(responses, latency=0.0, jitter=0.0, error_rate=0.0):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if latency or jitter:
+                time.sleep(latency + random.uniform(0, jitter))
+            if error_rate and random.random() < error_rate:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = responses.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return FixtureHandler
+
+def start_stub_server(fixtures_dir=FIXTURES_DIR, host='127.0.0.1', port=0,
+                      latency=0.0, jitter=0.0, error_rate=0.0):
+    """
+    Inicia o servidor em uma thread daemon e retorna (servidor, url_base).
+    Com port=0 o sistema escolhe uma porta livre. latency e jitter (s) atrasam
+    cada resposta; error_rate é a fração de respostas 503.
+    """
+    _, responses = load_fixtures(fixtures_dir)
+    server = ThreadingHTTPServer((host, port),
+                                 make_handler(responses, latency, jitter, error_rate))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local com respostas gravadas do IBGE.")
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--latencia', type=float, default=0.0,
+                        help="Atraso fixo de cada resposta (s)")
+    parser.add_argument('--variacao', type=float, default=0.0,
+                        help="Atraso aleatório adicional, de 0 até este valor (s)")
+    parser.add_argument('--erros', type=float, default=0.0,
+                        help="Fração das respostas que falham com 503 (0 a 1)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server, base_url = start_stub_server(args.fixtures, port=args.porta, latency=args.latencia,
+                                         jitter=args.variacao, error_rate=args.erros)
+    logger.info(f"Servindo fixtures em {base_url} (IBGE_API_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+"""
+Teste de carga de ponta a ponta: gunicorn com o app real, IBGE local.
+
+Para cada configuração do gunicorn (workers x threads) e cada nível de
+concorrência, sobe o app com as opções do Procfile, apontado para o
+servidor local de fixtures (com latência e erros injetáveis), e dispara
+clientes simultâneos contra os endpoints dos callbacks do Dash. Cada nível
+começa com um gunicorn novo, portanto com caches frios.
+
+Cenários (cada iteração de um cliente):
+    mapa      update_map com área e cor sorteadas (cor nova = renderização nova)
+    upload    upload de um CSV, adição da camada e update_map com os pontos
+    vetorial  dados do modo vetorial (contornos e pontos) para uma área sorteada
+
+Relatório por configuração e nível: vazão (iterações/s), latência p50/p95/p99,
+taxa de erros e RSS dos workers (soma e máximo, lido de /proc; só Linux).
+
+Os callbacks respondem 200 mesmo quando falham (o mapa volta vazio), então
+uma iteração só conta como sucesso se trouxer o resultado esperado: a URL
+da imagem em /mapas/ (e a imagem servida com 200 ou 304), a camada criada
+ou os dados vetoriais.
+
+Uso:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --configs 2x4,2x16,4x8 --concorrencia 1,8,32 \\
+        --duracao 30 --latencia 0.3 --variacao 0.2 --erros 0.02 --saida carga.json
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+PROCFILE_PATH = os.path.join(REPO_DIR, 'Procfile')
+
+sys.path.insert(0, BENCH_DIR)
+from ibge_stub import FIXTURES_DIR, start_stub_server  # noqa: E402
+from record_fixtures import REGION_ID, UF_ID, MUNICIPIO_ID  # noqa: E402
+
+# Valores de update_map por área: (pais, regiao, uf, municipio)
+AREAS = [
+    ('Brasil', None, None, None),
+    ('Brasil', REGION_ID, None, None),
+    ('Brasil', None, UF_ID, None),
+    ('Brasil', None, None, MUNICIPIO_ID),
+]
+
+# Retângulo envolvente do Brasil, para os pontos do CSV enviado
+POINTS_BBOX = (-74.0, -34.0, -34.8, 5.3)
+
+# Rota das imagens geradas (image_store.IMAGE_ROUTE)
+IMAGE_ROUTE = '/mapas/'
+
+# Status que contam como sucesso (a imagem pode vir do cache do navegador)
+OK_STATUSES = (200, 304)
+
+# Opções do Procfile substituídas pelo teste
+OVERRIDDEN_OPTIONS = {'--workers', '--threads', '--bind', '-b', '-w', '--log-file',
+                      '--access-logfile', '--error-logfile', '--log-level'}
+
+def procfile_command(path=PROCFILE_PATH):
+    """Linha 'web' do Procfile, sem as opções que o teste define."""
+    with open(path, encoding='utf-8') as f:
+        line = next(l for l in f if l.startswith('web:'))
+    args = shlex.split(line[len('web:'):])
+    command = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+            continue
+        option = arg.split('=', 1)[0]
+        if option in OVERRIDDEN_OPTIONS:
+            skip = '=' not in arg
+            continue
+        command.append(arg)
+    # O gunicorn do mesmo ambiente Python que roda o teste
+    if command and command[0] == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn'] + command[1:]
+    return command
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def child_pids(parent_pid):
+    """Processos filhos (workers do gunicorn), lidos de /proc."""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # O nome do processo (2º campo) pode ter espaços: o ppid vem após o ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == parent_pid:
+                pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+class AppServer:
+    """Gunicorn com o app, iniciado com as opções do Procfile."""
+
+    def __init__(self, workers, threads, ibge_url, log_path):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        command = procfile_command() + [
+            '--workers', str(workers), '--threads', str(threads),
+            '--bind', f'127.0.0.1:{self.port}', '--log-level', 'warning',
+            '--error-logfile', '-',
+        ]
+        env = {**os.environ, 'IBGE_API_URL': ibge_url}
+        self._log = open(log_path, 'ab')
+        self.process = subprocess.Popen(command, cwd=REPO_DIR, env=env,
+                                        stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=120):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn terminou com código {self.process.returncode}")
+            try:
+                if requests.get(self.url + '/_dash-layout', timeout=5).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError("gunicorn não respondeu a tempo")
+
+    def worker_rss(self):
+        """RSS (MB) de cada worker."""
+        return [rss_mb(pid) for pid in child_pids(self.process.pid)]
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+
+class DashClient:
+    """Monta as chamadas de /_dash-update-component a partir das dependências do app."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        response = requests.get(base_url + '/_dash-dependencies', timeout=30)
+        response.raise_for_status()
+        self.dependencies = response.json()
+
+    def _dependency(self, output):
+        for dependency in self.dependencies:
+            if output in dependency['output'] and dependency.get('clientside_function') is None:
+                return dependency
+        raise KeyError(f"Callback com saída {output} não encontrado")
+
+    def call(self, session, output, values, changed, timeout=120):
+        """
+        Chama o callback que produz output. values mapeia 'id.propriedade' ao
+        valor de cada entrada ou estado (ausentes vão como None). Retorna o
+        status HTTP e o dicionário 'response' do Dash (vazio em 204).
+        """
+        dependency = self._dependency(output)
+        outputs = dependency['output'].strip('.').split('...')
+
+        def props(items):
+            return [{'id': item['id'], 'property': item['property'],
+                     'value': values.get(f"{item['id']}.{item['property']}")}
+                    for item in items]
+
+        body = {
+            'output': dependency['output'],
+            'outputs': [dict(zip(('id', 'property'), o.rsplit('.', 1))) for o in outputs],
+            'inputs': props(dependency['inputs']),
+            'state': props(dependency['state']),
+            'changedPropIds': [changed],
+        }
+        if len(outputs) == 1:
+            body['outputs'] = body['outputs'][0]
+        response = session.post(self.base_url + '/_dash-update-component', json=body,
+                                 timeout=timeout)
+        payload = response.json().get('response', {}) if response.status_code == 200 else {}
+        return response.status_code, payload
+
+def _map_values(rng, session_id, layers=None):
+    pais, regiao, uf, municipio = rng.choice(AREAS)
+    return {
+        'pais-dropdown.value': pais,
+        'regiao-dropdown.value': regiao,
+        'uf-dropdown.value': uf,
+        'municipios-dropdown.value': municipio,
+        'layers-render.data': layers or [],
+        'map-style.data': {
+            'color_map': '#%06x' % rng.randrange(0x1000000),
+            'color_border': '#ffffff',
+            'border_thickness': 0.5,
+            'show_axes': False,
+            'show_legend': True,
+            'show_compass': True,
+        },
+        'map-mode.value': 'imagem',
+        'projection-dropdown.value': 'EPSG:4326',
+        'session-id.data': session_id,
+    }
+
+def _csv_upload(rng, n_points):
+    lon_min, lat_min, lon_max, lat_max = POINTS_BBOX
+    lines = ['latitude,longitude']
+    lines += [f"{rng.uniform(lat_min, lat_max):.5f},{rng.uniform(lon_min, lon_max):.5f}"
+              for _ in range(n_points)]
+    encoded = base64.b64encode('\n'.join(lines).encode('utf-8')).decode('ascii')
+    return f'data:text/csv;base64,{encoded}'
+
+def _check_map(client, session, status, payload):
+    """Status da resposta do mapa e da imagem; erros do callback viram 'sem imagem'."""
+    if status != 200:
+        return [status]
+    src = payload.get('mapa', {}).get('src')
+    if not isinstance(src, str) or not src.startswith(IMAGE_ROUTE):
+        return [status, 'sem imagem']
+    image = session.get(client.base_url + src, timeout=60)
+    return [status, image.status_code]
+
+def scenario_mapa(client, session, rng, session_id, n_points):
+    status, payload = client.call(session, 'mapa.src', _map_values(rng, session_id),
+                                  'map-style.data')
+    return _check_map(client, session, status, payload)
+
+def scenario_vetorial(client, session, rng, session_id, n_points):
+    values = _map_values(rng, session_id)
+    values['map-mode.value'] = 'vetorial'
+    status, payload = client.call(session, 'vector-data.data', values, 'map-mode.value')
+    data = payload.get('vector-data', {}).get('data')
+    if status == 200 and not (data and data.get('boundary')):
+        return [status, 'sem dados vetoriais']
+    return [status]
+
+def scenario_upload(client, session, rng, session_id, n_points):
+    statuses = []
+    status, uploaded = client.call(session, 'uploaded-data-store.data', {
+        'upload-data.contents': _csv_upload(rng, n_points),
+        'upload-data.filename': 'pontos.csv',
+    }, 'upload-data.contents')
+    statuses.append(status)
+    records = uploaded.get('uploaded-data-store', {}).get('data')
+    if status != 200 or not records:
+        return statuses + ['sem dados']
+
+    status, updated = client.call(session, 'layers-store.data', {
+        'add-points-button.n_clicks': 1,
+        'uploaded-data-store.data': records,
+        'latitude-column.value': 'latitude',
+        'longitude-column.value': 'longitude',
+        'layer-name-input.value': 'Carga',
+        'layers-store.data': [],
+    }, 'add-points-button.n_clicks')
+    statuses.append(status)
+    layers = updated.get('layers-store', {}).get('data')
+    if status != 200 or not layers:
+        return statuses + ['sem camada']
+
+    status, payload = client.call(session, 'mapa.src', _map_values(rng, session_id, layers),
+                                  'layers-render.data')
+    return statuses + _check_map(client, session, status, payload)
+
+SCENARIOS = {'mapa': scenario_mapa, 'upload': scenario_upload, 'vetorial': scenario_vetorial}
+
+def run_level(base_url, scenario, concurrency, duration, n_points, seed, sample_rss):
+    """Clientes em laço fechado durante duration segundos; retorna as iterações."""
+    client = DashClient(base_url)
+    deadline = time.monotonic() + duration
+    results = []
+    results_lock = threading.Lock()
+    rss_samples = []
+    stop_sampling = threading.Event()
+
+    def sampler():
+        while not stop_sampling.wait(0.5):
+            rss_samples.append(sample_rss())
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        # Um id de sessão por cliente, como uma aba do navegador
+        session_id = f'carga-{index}'
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                statuses = SCENARIOS[scenario](client, session, rng, session_id, n_points)
+                ok = all(s in OK_STATUSES for s in statuses)
+            except Exception as e:
+                statuses, ok = [type(e).__name__], False
+            with results_lock:
+                results.append({'s': time.perf_counter() - start, 'ok': ok,
+                                'status': statuses})
+
+    thread = threading.Thread(target=sampler, daemon=True)
+    thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop_sampling.set()
+    thread.join()
+    rss_samples.append(sample_rss())
+    return results, elapsed, rss_samples
+
+def summarize(results, elapsed, rss_samples):
+    latencies = np.array([r['s'] for r in results]) if results else np.zeros(1)
+    errors = sum(not r['ok'] for r in results)
+    return {
+        'iteracoes': len(results),
+        'vazao_por_s': len(results) / elapsed if elapsed else 0.0,
+        'p50_s': float(np.percentile(latencies, 50)),
+        'p95_s': float(np.percentile(latencies, 95)),
+        'p99_s': float(np.percentile(latencies, 99)),
+        'taxa_erros': errors / len(results) if results else 0.0,
+        'rss_total_mb': max((sum(s) for s in rss_samples), default=0.0),
+        'rss_max_worker_mb': max((max(s, default=0.0) for s in rss_samples), default=0.0),
+    }
+
+def parse_configs(text):
+    configs = []
+    for item in text.split(','):
+        workers, threads = item.lower().split('x')
+        configs.append((int(workers), int(threads)))
+    return configs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do PyMaps com IBGE local.")
+    parser.add_argument('--configs', default='2x4,2x16',
+                        help="Configurações do gunicorn, WORKERSxTHREADS separadas por vírgula")
+    parser.add_argument('--concorrencia', default='1,4,8,16,32',
+                        help="Níveis de clientes simultâneos, em ordem crescente")
+    parser.add_argument('--cenarios', default='mapa,upload',
+                        help=f"Cenários: {', '.join(SCENARIOS)}")
+    parser.add_argument('--duracao', type=float, default=20, help="Duração de cada nível (s)")
+    parser.add_argument('--pontos', type=int, default=300,
+                        help="Linhas do CSV enviado (o app aceita arquivos de até 10 KB)")
+    parser.add_argument('--latencia', type=float, default=0.2,
+                        help="Latência fixa do IBGE local (s)")
+    parser.add_argument('--variacao', type=float, default=0.1,
+                        help="Latência aleatória adicional do IBGE local (s)")
+    parser.add_argument('--erros', type=float, default=0.0,
+                        help="Fração das respostas do IBGE local que falham com 503")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--log', default='load_test_gunicorn.log',
+                        help="Arquivo com a saída do gunicorn")
+    parser.add_argument('--saida', default=None, help="Grava os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    levels = [int(c) for c in args.concorrencia.split(',')]
+    scenarios = args.cenarios.split(',')
+    stub, ibge_url = start_stub_server(args.fixtures, latency=args.latencia,
+                                       jitter=args.variacao, error_rate=args.erros)
+    print(f"IBGE local em {ibge_url} (latência {args.latencia}+{args.variacao} s, "
+          f"erros {args.erros:.0%})")
+    print(f"{'config':<8} {'cenário':<8} {'conc':>5} {'iter':>6} {'it/s':>8} {'p50':>8} "
+          f"{'p95':>8} {'p99':>8} {'erros':>7} {'RSS tot':>9} {'RSS máx':>9}")
+
+    report = []
+    try:
+        for workers, threads in parse_configs(args.configs):
+            config = f'{workers}x{threads}'
+            for scenario in scenarios:
+                for concurrency in levels:
+                    # gunicorn novo a cada nível: cada medição começa com caches frios
+                    app = AppServer(workers, threads, ibge_url, args.log)
+                    try:
+                        app.wait_ready()
+                        results, elapsed, rss = run_level(app.url, scenario, concurrency,
+                                                          args.duracao, args.pontos,
+                                                          args.seed, app.worker_rss)
+                    finally:
+                        app.stop()
+                    summary = summarize(results, elapsed, rss)
+                    report.append({'config': config, 'workers': workers, 'threads': threads,
+                                   'cenario': scenario, 'concorrencia': concurrency,
+                                   **summary})
+                    print(f"{config:<8} {scenario:<8} {concurrency:>5} "
+                          f"{summary['iteracoes']:>6} {summary['vazao_por_s']:>8.2f} "
+                          f"{summary['p50_s']:>8.3f} {summary['p95_s']:>8.3f} "
+                          f"{summary['p99_s']:>8.3f} {summary['taxa_erros']:>7.1%} "
+                          f"{summary['rss_total_mb']:>9.1f} {summary['rss_max_worker_mb']:>9.1f}",
+                          flush=True)
+    finally:
+        stub.shutdown()
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': vars(args), 'resultados': report}, f, indent=2)
+        print(f"Resultados gravados em {args.saida}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
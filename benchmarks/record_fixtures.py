@@ -0,0 +1,214 @@
+"""
+Grava as respostas da API do IBGE usadas pelos benchmarks em
+benchmarks/fixtures, para que rodem sem acesso à rede.
+
+Uso:
+    python benchmarks/record_fixtures.py              # grava da API do IBGE
+    python benchmarks/record_fixtures.py --sintetico  # gera malhas sintéticas
+
+O modo sintético produz respostas no mesmo formato da API (mesmos ids de
+regiões e UFs, municípios e polígonos fictícios). Serve para rodar o
+harness sem rede, mas seus números não são comparáveis aos das fixtures
+gravadas: o baseline guarda o identificador do conjunto de fixtures.
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import os
+import sys
+
+import requests
+
+from ibge_stub import FIXTURES_DIR
+
+IBGE_API_URL = 'https://servicodados.ibge.gov.br/api'
+
+GEOJSON = 'formato=application/vnd.geo+json'
+
+# Áreas usadas nos benchmarks (uma por nível)
+REGION_ID = 3          # Sudeste
+UF_ID = 35             # São Paulo
+MUNICIPIO_ID = 3550308  # São Paulo (capital)
+
+FIXTURE_PATHS = [
+    '/v1/localidades/regioes',
+    '/v1/localidades/estados',
+    '/v1/localidades/municipios',
+    f'/v1/localidades/regioes/{REGION_ID}',
+    f'/v1/localidades/regioes/{REGION_ID}/estados',
+    f'/v1/localidades/estados/{UF_ID}',
+    f'/v1/localidades/estados/{UF_ID}/municipios',
+    f'/v1/localidades/municipios/{MUNICIPIO_ID}',
+    f'/v3/malhas/paises/BR?intrarregiao=UF&{GEOJSON}',
+    f'/v3/malhas/regioes/{REGION_ID}?intrarregiao=UF&{GEOJSON}',
+    f'/v3/malhas/estados/{UF_ID}?intrarregiao=municipio&{GEOJSON}',
+    f'/v3/malhas/municipios/{MUNICIPIO_ID}?{GEOJSON}',
+    f'/v3/malhas/paises/BR?intrarregiao=municipio&qualidade=minima&{GEOJSON}',
+]
+
+REGIONS = {1: ('N', 'Norte'), 2: ('NE', 'Nordeste'), 3: ('SE', 'Sudeste'),
+           4: ('S', 'Sul'), 5: ('CO', 'Centro-Oeste')}
+
+UFS = {
+    11: ('RO', 'Rondônia'), 12: ('AC', 'Acre'), 13: ('AM', 'Amazonas'),
+    14: ('RR', 'Roraima'), 15: ('PA', 'Pará'), 16: ('AP', 'Amapá'),
+    17: ('TO', 'Tocantins'), 21: ('MA', 'Maranhão'), 22: ('PI', 'Piauí'),
+    23: ('CE', 'Ceará'), 24: ('RN', 'Rio Grande do Norte'), 25: ('PB', 'Paraíba'),
+    26: ('PE', 'Pernambuco'), 27: ('AL', 'Alagoas'), 28: ('SE', 'Sergipe'),
+    29: ('BA', 'Bahia'), 31: ('MG', 'Minas Gerais'), 32: ('ES', 'Espírito Santo'),
+    33: ('RJ', 'Rio de Janeiro'), 35: ('SP', 'São Paulo'), 41: ('PR', 'Paraná'),
+    42: ('SC', 'Santa Catarina'), 43: ('RS', 'Rio Grande do Sul'),
+    50: ('MS', 'Mato Grosso do Sul'), 51: ('MT', 'Mato Grosso'),
+    52: ('GO', 'Goiás'), 53: ('DF', 'Distrito Federal'),
+}
+
+def record_from_ibge(paths):
+    responses = {}
+    for path in paths:
+        print(f"Gravando {path}")
+        response = requests.get(IBGE_API_URL + path, timeout=60)
+        response.raise_for_status()
+        responses[path] = response.content
+    return responses
+
+# --- Fixtures sintéticas -------------------------------------------------
+
+MUNICIPIOS_PER_UF = 40
+GRID_COLS = 6
+BBOX = (-74.0, -34.0, -34.0, 5.0)
+
+def _ring(x0, y0, x1, y1, vertices_per_side=60):
+    """Retângulo com bordas onduladas, para ter custo de desenho realista."""
+    points = []
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+        for k in range(vertices_per_side):
+            t = k / vertices_per_side
+            wobble = 0.02 * math.sin(t * math.pi * 8)
+            x, y = ax + (bx - ax) * t, ay + (by - ay) * t
+            if ax == bx:
+                x += wobble
+            else:
+                y += wobble
+            points.append([x, y])
+    points.append(points[0])
+    return points
+
+def _uf_cell(index):
+    x0, y0, x1, y1 = BBOX
+    rows = math.ceil(len(UFS) / GRID_COLS)
+    width, height = (x1 - x0) / GRID_COLS, (y1 - y0) / rows
+    col, row = index % GRID_COLS, index // GRID_COLS
+    return (x0 + col * width, y0 + row * height,
+            x0 + (col + 1) * width, y0 + (row + 1) * height)
+
+def _municipio_cells(cell):
+    x0, y0, x1, y1 = cell
+    side = math.ceil(math.sqrt(MUNICIPIOS_PER_UF))
+    width, height = (x1 - x0) / side, (y1 - y0) / side
+    for k in range(MUNICIPIOS_PER_UF):
+        col, row = k % side, k // side
+        yield (x0 + col * width, y0 + row * height,
+               x0 + (col + 1) * width, y0 + (row + 1) * height)
+
+def _feature(codarea, cell, vertices_per_side=60):
+    return {'type': 'Feature', 'properties': {'codarea': str(codarea)},
+            'geometry': {'type': 'Polygon',
+                         'coordinates': [_ring(*cell, vertices_per_side)]}}
+
+def _collection(features):
+    return {'type': 'FeatureCollection', 'features': features}
+
+def _municipio_id(uf_id, k):
+    if uf_id == UF_ID and k == 0:
+        return MUNICIPIO_ID
+    return uf_id * 100000 + (k + 1) * 10
+
+def synthetic_responses():
+    regions = [{'id': rid, 'sigla': sigla, 'nome': nome}
+               for rid, (sigla, nome) in REGIONS.items()]
+    region_by_id = {r['id']: r for r in regions}
+    ufs = [{'id': uid, 'sigla': sigla, 'nome': nome, 'regiao': region_by_id[uid // 10]}
+           for uid, (sigla, nome) in UFS.items()]
+
+    municipios = []
+    uf_cells = {}
+    municipio_cells = {}
+    for index, uf in enumerate(ufs):
+        uf_cells[uf['id']] = _uf_cell(index)
+        for k, cell in enumerate(_municipio_cells(uf_cells[uf['id']])):
+            mid = _municipio_id(uf['id'], k)
+            municipio_cells[mid] = (uf['id'], cell)
+            nome = 'São Paulo' if mid == MUNICIPIO_ID else f"Município {uf['sigla']} {k + 1}"
+            municipios.append({
+                'id': mid, 'nome': nome,
+                'microrregiao': {
+                    'id': uf['id'] * 1000 + k // 10, 'nome': f"Micro {uf['sigla']} {k // 10}",
+                    'mesorregiao': {'id': uf['id'] * 100 + k // 20,
+                                    'nome': f"Meso {uf['sigla']} {k // 20}", 'UF': uf}
+                },
+            })
+
+    def uf_features(region_id=None):
+        return [_feature(uf['id'], uf_cells[uf['id']])
+                for uf in ufs if region_id is None or uf['regiao']['id'] == region_id]
+
+    municipio = next(m for m in municipios if m['id'] == MUNICIPIO_ID)
+    data = {
+        '/v1/localidades/regioes': regions,
+        '/v1/localidades/estados': ufs,
+        '/v1/localidades/municipios': municipios,
+        f'/v1/localidades/regioes/{REGION_ID}': region_by_id[REGION_ID],
+        f'/v1/localidades/regioes/{REGION_ID}/estados':
+            [uf for uf in ufs if uf['regiao']['id'] == REGION_ID],
+        f'/v1/localidades/estados/{UF_ID}': next(uf for uf in ufs if uf['id'] == UF_ID),
+        f'/v1/localidades/estados/{UF_ID}/municipios':
+            [m for m in municipios if m['id'] // 100000 == UF_ID],
+        f'/v1/localidades/municipios/{MUNICIPIO_ID}': municipio,
+        f'/v3/malhas/paises/BR?intrarregiao=UF&{GEOJSON}': _collection(uf_features()),
+        f'/v3/malhas/regioes/{REGION_ID}?intrarregiao=UF&{GEOJSON}':
+            _collection(uf_features(REGION_ID)),
+        f'/v3/malhas/estados/{UF_ID}?intrarregiao=municipio&{GEOJSON}': _collection([
+            _feature(mid, cell, 15) for mid, (uf_id, cell) in municipio_cells.items()
+            if uf_id == UF_ID
+        ]),
+        f'/v3/malhas/municipios/{MUNICIPIO_ID}?{GEOJSON}':
+            _collection([_feature(MUNICIPIO_ID, municipio_cells[MUNICIPIO_ID][1])]),
+        f'/v3/malhas/paises/BR?intrarregiao=municipio&qualidade=minima&{GEOJSON}':
+            _collection([_feature(mid, cell, 4) for mid, (uf_id, cell) in municipio_cells.items()]),
+    }
+    return {path: json.dumps(body, ensure_ascii=False).encode('utf-8')
+            for path, body in data.items()}
+
+def write_fixtures(responses, source, fixtures_dir=FIXTURES_DIR):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    index = {'source': source,
+             'recorded_at': datetime.datetime.now().isoformat(timespec='seconds'),
+             'responses': {}}
+    for path, content in responses.items():
+        filename = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16] + '.json.gz'
+        with open(os.path.join(fixtures_dir, filename), 'wb') as f:
+            # mtime fixo: o mesmo conteúdo gera sempre os mesmos bytes
+            f.write(gzip.compress(content, mtime=0))
+        index['responses'][path] = filename
+    with open(os.path.join(fixtures_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grava fixtures da API do IBGE para os benchmarks.")
+    parser.add_argument('--sintetico', action='store_true',
+                        help="Gera respostas sintéticas em vez de acessar a API")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    args = parser.parse_args(argv)
+
+    if args.sintetico:
+        write_fixtures(synthetic_responses(), 'sintetico', args.fixtures)
+    else:
+        write_fixtures(record_from_ibge(FIXTURE_PATHS), 'ibge', args.fixtures)
+    print(f"Fixtures gravadas em {args.fixtures}")
+
+if __name__ == '__main__':
+    sys.exit(main())
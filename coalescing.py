@@ -0,0 +1,48 @@
+"""
+Coalescência das atualizações do mapa por sessão.
+
+Cada aba do navegador tem um id de sessão (dcc.Store 'session-id') e cada
+chamada de update_map recebe um número de geração crescente para essa
+sessão. Antes de renderizar, a chamada espera uma janela curta e desiste
+(devolvendo dash.no_update) se outra mais recente da mesma sessão já chegou: ao arrastar
+um seletor de cor, só o último conjunto de parâmetros é renderizado.
+
+O contador é por processo; com vários workers, chamadas da mesma sessão que
+caem em workers diferentes não se coalescem entre si.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+import cachetools
+
+# Espera antes de renderizar, para que chamadas mais novas da sessão cheguem
+COALESCE_WINDOW = float(os.environ.get('PYMAPS_COALESCE_WINDOW', 0.15))
+
+_lock = threading.Lock()
+# Última geração de cada sessão (sessões inativas expiram em 1 hora)
+_generations = cachetools.TTLCache(maxsize=10000, ttl=3600)
+
+def begin(session_id: Optional[str]) -> int:
+    """Registra uma nova chamada da sessão e retorna sua geração."""
+    if not session_id:
+        return 0
+    with _lock:
+        generation = _generations.get(session_id, 0) + 1
+        _generations[session_id] = generation
+    return generation
+
+def is_stale(session_id: Optional[str], generation: int) -> bool:
+    """Indica se já chegou uma chamada mais recente da mesma sessão."""
+    if not session_id:
+        return False
+    with _lock:
+        return _generations.get(session_id, generation) > generation
+
+def wait_latest(session_id: Optional[str], generation: int,
+                window: float = COALESCE_WINDOW) -> bool:
+    """Espera a janela de coalescência; False se a chamada ficou obsoleta."""
+    if session_id and window > 0:
+        time.sleep(window)
+    return not is_stale(session_id, generation)
@@ -0,0 +1,192 @@
+"""
+Limpeza e validação das colunas de latitude e longitude.
+
+As colunas enviadas pelo usuário chegam como números, textos com vírgula
+decimal ("-23,55"), graus/minutos/segundos ("23°33'S") ou células vazias.
+A conversão é feita sobre a coluna inteira: valores já numéricos passam
+direto para float, a vírgula decimal é trocada de uma vez no texto da
+coluna e só as células restantes passam pelas expressões regulares.
+
+Cada linha recebe um código de motivo (REASON_*): vazia, ilegível, fora da
+faixa válida, fora do Brasil ou com latitude e longitude trocadas (nesse
+caso os valores são corrigidos e a linha é mantida).
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Códigos de motivo por linha
+REASON_OK = 0
+REASON_MISSING = 1
+REASON_UNPARSEABLE = 2
+REASON_OUT_OF_RANGE = 3
+REASON_OUTSIDE_BRAZIL = 4
+REASON_SWAPPED = 5
+REASON_NOT_FOUND = 6
+REASON_AMBIGUOUS = 7
+
+REASON_LABELS = {
+    REASON_OK: 'válidas',
+    REASON_MISSING: 'vazias',
+    REASON_UNPARSEABLE: 'ilegíveis',
+    REASON_OUT_OF_RANGE: 'fora da faixa',
+    REASON_OUTSIDE_BRAZIL: 'fora do Brasil',
+    REASON_SWAPPED: 'lat/lon trocadas (corrigidas)',
+    REASON_NOT_FOUND: 'municípios não encontrados',
+    REASON_AMBIGUOUS: 'nomes ambíguos (informe a UF)',
+}
+
+# Retângulo envolvente do Brasil, com ilhas oceânicas e uma pequena margem
+# (lon_min, lat_min, lon_max, lat_max)
+BRAZIL_BBOX = (-74.5, -34.5, -28.0, 6.0)
+
+# Graus com minutos e segundos opcionais e hemisfério opcional
+# (N/S/E/W, ou L/O em português): "23°33'1\"S", "46 38 W", "-23.5"
+_DMS_PATTERN = (
+    r'^(?P<sign>[-+])?(?P<deg>\d+(?:\.\d+)?)\s*(?:[°º˚:]|\s)?\s*'
+    r'(?:(?P<min>\d+(?:\.\d+)?)\s*(?:[\'′’:]|\s)?\s*)?'
+    r'(?:(?P<sec>\d+(?:\.\d+)?)\s*(?:"|″|\'\')?\s*)?'
+    r'(?P<hem>[NSEWLO])?$'
+)
+
+def _normalize_decimal(text: pd.Series) -> pd.Series:
+    """
+    Normaliza separadores decimais: "-23,55" e "1.234,5" (pt-BR) viram
+    "-23.55" e "1234.5"; "1,234.5" vira "1234.5".
+    """
+    last_comma = text.str.rfind(',')
+    last_dot = text.str.rfind('.')
+    comma_decimal = last_comma > last_dot
+    text = text.where(~comma_decimal,
+                      text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return text.where(comma_decimal, text.str.replace(',', '', regex=False))
+
+def _parse_dms(text: pd.Series) -> pd.Series:
+    """Converte graus/minutos/segundos com hemisfério em graus decimais."""
+    parts = text.str.extract(_DMS_PATTERN)
+    degrees = pd.to_numeric(parts['deg'], errors='coerce')
+    minutes = pd.to_numeric(parts['min'], errors='coerce').fillna(0)
+    seconds = pd.to_numeric(parts['sec'], errors='coerce').fillna(0)
+    value = degrees + minutes / 60 + seconds / 3600
+    negative = (parts['sign'] == '-') | parts['hem'].isin(['S', 'W', 'O'])
+    value = value.where(~negative, -value)
+    # Minutos e segundos só são válidos abaixo de 60
+    return value.where((minutes < 60) & (seconds < 60))
+
+def parse_coordinates(values) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converte uma coluna de coordenadas em float. Retorna os valores (NaN onde
+    não foi possível converter) e a máscara das células vazias.
+    """
+    # Índice posicional: as etapas abaixo combinam subconjuntos por rótulo
+    series = pd.Series(values, copy=False).reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        parsed = series.to_numpy(dtype=float, na_value=np.nan)
+        return parsed, np.isnan(parsed)
+
+    # Caminho rápido: números e textos numéricos simples
+    parsed = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan,
+                                                            copy=True)
+    pending = np.isnan(parsed)
+    if not pending.any():
+        return parsed, pending
+
+    # Vírgula decimal ("-23,55"): troca feita de uma vez sobre o texto da coluna
+    text = series[pending].fillna('').astype(str)
+    swapped_text = '\x00'.join(text.tolist()).replace(',', '.').split('\x00')
+    if len(swapped_text) == len(text):
+        value = pd.to_numeric(pd.Series(swapped_text, index=text.index), errors='coerce')
+    else:
+        value = pd.to_numeric(text.str.replace(',', '.', regex=False), errors='coerce')
+
+    # O restante (vazios, milhar, graus/minutos/segundos) é tratado à parte
+    missing = np.zeros(len(series), dtype=bool)
+    rest = value.isna()
+    if rest.any():
+        rest_text = text[rest].str.strip()
+        missing_text = (series[pending][rest].isna() |
+                        rest_text.str.lower().isin(['', 'nan', 'none', 'null', 'na', 'n/a', '-']))
+        missing[np.flatnonzero(pending)[rest.to_numpy()]] = missing_text.to_numpy()
+
+        rest_text = rest_text[~missing_text].str.upper().str.replace('−', '-', regex=False)
+        rest_text = _normalize_decimal(rest_text)
+        rest_value = pd.to_numeric(rest_text, errors='coerce')
+        dms = rest_value.isna()
+        if dms.any():
+            rest_value[dms] = _parse_dms(rest_text[dms])
+        value[rest_value.index] = rest_value
+
+    parsed[pending] = value.to_numpy(dtype=float, na_value=np.nan)
+    return parsed, missing
+
+def in_bbox(latitudes: np.ndarray, longitudes: np.ndarray, bbox=BRAZIL_BBOX) -> np.ndarray:
+    """Máscara dos pontos dentro do retângulo (lon_min, lat_min, lon_max, lat_max)."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    return ((latitudes >= lat_min) & (latitudes <= lat_max) &
+            (longitudes >= lon_min) & (longitudes <= lon_max))
+
+@dataclass
+class CleanedCoordinates:
+    """Coordenadas convertidas e o motivo de cada linha."""
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    reasons: np.ndarray
+
+    @property
+    def valid(self) -> np.ndarray:
+        """Máscara das linhas que seguem para o mapa."""
+        return (self.reasons == REASON_OK) | (self.reasons == REASON_SWAPPED)
+
+    def valid_points(self) -> Tuple[np.ndarray, np.ndarray]:
+        valid = self.valid
+        return self.latitudes[valid], self.longitudes[valid]
+
+    def summary(self) -> Dict[str, int]:
+        """Quantidade de linhas por motivo (só os motivos presentes)."""
+        counts = np.bincount(self.reasons, minlength=len(REASON_LABELS))
+        return {REASON_LABELS[reason]: int(count)
+                for reason, count in enumerate(counts) if count}
+
+    def message(self) -> Optional[str]:
+        """Resumo das linhas descartadas ou corrigidas, para exibir ao usuário."""
+        problems = {label: count for label, count in self.summary().items()
+                    if label != REASON_LABELS[REASON_OK]}
+        if not problems:
+            return None
+        details = ', '.join(f"{count} {label}" for label, count in problems.items())
+        return f"{int(self.valid.sum())} de {len(self.reasons)} pontos válidos. Linhas: {details}."
+
+def clean_coordinates(latitudes, longitudes, bbox=BRAZIL_BBOX,
+                      detect_swaps=True) -> CleanedCoordinates:
+    """
+    Converte e valida as colunas de latitude e longitude. Com bbox (padrão:
+    Brasil), pontos fora dele são marcados; se trocar latitude e longitude
+    coloca o ponto dentro do bbox, os valores são trocados e a linha mantida.
+    """
+    lat, lat_missing = parse_coordinates(latitudes)
+    lon, lon_missing = parse_coordinates(longitudes)
+
+    reasons = np.full(len(lat), REASON_OK, dtype=np.uint8)
+    unparseable = np.isnan(lat) | np.isnan(lon)
+    missing = lat_missing | lon_missing
+
+    with np.errstate(invalid='ignore'):
+        in_range = (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+
+    if bbox is not None:
+        inside = in_bbox(lat, lon, bbox)
+        swapped = np.zeros(len(lat), dtype=bool)
+        if detect_swaps:
+            swapped = ~inside & in_bbox(lon, lat, bbox)
+            lat, lon = np.where(swapped, lon, lat), np.where(swapped, lat, lon)
+        reasons[~inside & ~swapped] = REASON_OUTSIDE_BRAZIL
+        reasons[swapped] = REASON_SWAPPED
+
+    # Do menos para o mais grave: prevalece o último motivo atribuído (pontos
+    # trocados estão no bbox depois da troca, logo sempre na faixa válida)
+    reasons[~in_range] = REASON_OUT_OF_RANGE
+    reasons[unparseable] = REASON_UNPARSEABLE
+    reasons[missing] = REASON_MISSING
+    return CleanedCoordinates(lat, lon, reasons)
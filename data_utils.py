@@ -1,76 +1,126 @@
-import requests
 import pandas as pd
 import io
 import base64
-import cachetools
 from typing import Dict, List, Optional, Tuple, Any
 import logging
+import os
+import threading
+import time
+import async_io
+from localities import LocalityTable
+from metrics import record_cache, span
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cache para dados da API (1 hora)
-API_CACHE = cachetools.TTLCache(maxsize=100, ttl=3600)
+# Validade da tabela de localidades (segundos); vencida, continua em uso até ser renovada
+LOCALITY_TTL = 3600
+
+# Espera antes de tentar de novo após uma falha ao carregar as localidades (segundos)
+LOCALITY_RETRY = float(os.environ.get('PYMAPS_LOCALITY_RETRY', 30))
+
+# Tabela compacta das localidades, montada a partir das listas completas
+_locality = {'table': None, 'expires': 0.0, 'retry_at': 0.0, 'loading': False}
+_locality_cond = threading.Condition()
+
+# Tempo limite das listas completas (a de municípios tem alguns MB)
+BULK_TIMEOUT = 30
+
+# URL base da API do IBGE (pode apontar para um servidor local, p.ex. nos benchmarks)
+IBGE_API_URL = os.environ.get('IBGE_API_URL', 'https://servicodados.ibge.gov.br/api').rstrip('/')
 
 # Configurações
 MAX_FILE_SIZE = 10 * 1024  # 10 KB
 MAX_ROWS = 1000  # Máximo de linhas para processamento
 
-def get_cached_api_data(url: str) -> Optional[List[Dict]]:
-    """Obtém dados da API com cache."""
-    if url in API_CACHE:
-        return API_CACHE[url]
-    
+def _load_locality_table() -> Optional[LocalityTable]:
+    """Busca as listas completas (em paralelo) e monta a tabela; None em caso de erro."""
+    urls = [f"{IBGE_API_URL}/v1/localidades/{level}"
+            for level in ('regioes', 'estados', 'municipios')]
+    with span('fetch_localidades'):
+        responses = async_io.fetch_many(urls, BULK_TIMEOUT)
+    (_, regions), (_, ufs), (_, municipios) = responses
+    if not regions or not ufs or not municipios:
+        logger.error(f"Erro ao carregar localidades: status {[s for s, _ in responses]}")
+        return None
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        API_CACHE[url] = data
-        return data
+        table = LocalityTable(regions, ufs, municipios)
     except Exception as e:
-        logger.error(f"Erro ao acessar API: {e}")
+        logger.error(f"Erro ao montar tabela de localidades: {e}")
         return None
+    logger.info(f"Tabela de localidades montada: {len(table)} municípios")
+    return table
+
+def get_locality_table() -> Optional[LocalityTable]:
+    """
+    Tabela (e índice hierárquico) das localidades, montada uma vez a partir
+    das listas completas de regiões, UFs e municípios. O JSON bruto é
+    descartado após a montagem. O layout a monta na inicialização, de modo
+    que os callbacks não fazem consultas à API de localidades.
+
+    Uma única thread busca as listas, fora da trava. Vencida a validade, as
+    demais continuam recebendo a tabela antiga até a nova ficar pronta; após
+    uma falha, nenhuma nova tentativa é feita por LOCALITY_RETRY segundos.
+    """
+    table = _locality['table']
+    if table is not None and time.monotonic() < _locality['expires']:
+        record_cache('localidades', True)
+        return table
+    record_cache('localidades', False)
+
+    with _locality_cond:
+        now = time.monotonic()
+        table = _locality['table']
+        if table is not None and now < _locality['expires']:
+            return table
+        if now < _locality['retry_at']:
+            return table
+        if _locality['loading']:
+            # Sem tabela antiga, espera a montagem em andamento
+            if table is None:
+                _locality_cond.wait_for(lambda: not _locality['loading'], BULK_TIMEOUT * 2)
+            return _locality['table']
+        _locality['loading'] = True
+
+    table = None
+    try:
+        table = _load_locality_table()
+    finally:
+        with _locality_cond:
+            if table is not None:
+                _locality['table'] = table
+                _locality['expires'] = time.monotonic() + LOCALITY_TTL
+            else:
+                _locality['retry_at'] = time.monotonic() + LOCALITY_RETRY
+            _locality['loading'] = False
+            _locality_cond.notify_all()
+    return _locality['table']
 
 def get_regions() -> List[Dict]:
     """Obtém lista de regiões."""
-    url = "https://servicodados.ibge.gov.br/api/v1/localidades/regioes"
-    data = get_cached_api_data(url)
-    if not data:
-        return []
-    return [{'label': region['nome'], 'value': region['id']} for region in data]
+    table = get_locality_table()
+    return table.region_options if table else []
 
 def get_ufs() -> List[Dict]:
     """Obtém lista de UFs."""
-    url = "https://servicodados.ibge.gov.br/api/v1/localidades/estados"
-    data = get_cached_api_data(url)
-    if not data:
-        return []
-    return [{'label': uf['nome'], 'value': uf['id']} for uf in data]
+    table = get_locality_table()
+    return table.uf_options if table else []
 
 def get_ufs_by_region(region_id: int) -> List[Dict]:
     """Obtém UFs por região."""
-    url = f"https://servicodados.ibge.gov.br/api/v1/localidades/regioes/{region_id}/estados"
-    data = get_cached_api_data(url)
-    if not data:
-        return []
-    return [{'label': uf['nome'], 'value': uf['id']} for uf in data]
+    table = get_locality_table()
+    return table.ufs_of_region(region_id) if table else []
 
 def get_all_municipios() -> List[Dict]:
     """Obtém todos os municípios."""
-    url = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
-    data = get_cached_api_data(url)
-    if not data:
-        return []
-    return [{'label': municipio['nome'], 'value': municipio['id']} for municipio in data]
+    table = get_locality_table()
+    return table.municipio_options if table else []
 
 def get_municipios_by_uf(uf_id: int) -> List[Dict]:
     """Obtém municípios por UF."""
-    url = f"https://servicodados.ibge.gov.br/api/v1/localidades/estados/{uf_id}/municipios"
-    data = get_cached_api_data(url)
-    if not data:
-        return []
-    return [{'label': municipio['nome'], 'value': municipio['id']} for municipio in data]
+    table = get_locality_table()
+    return table.municipios_of_uf(uf_id) if table else []
 
 def load_data_from_contents(contents: str, filename: str) -> Optional[pd.DataFrame]:
     """
@@ -105,16 +155,11 @@ def load_data_from_contents(contents: str, filename: str) -> Optional[pd.DataFra
         return None
 
 def get_area_name(area_type: str, area_id: int) -> str:
-    """Obtém nome da área geográfica."""
-    url_mapping = {
-        'region': f"https://servicodados.ibge.gov.br/api/v1/localidades/regioes/{area_id}",
-        'uf': f"https://servicodados.ibge.gov.br/api/v1/localidades/estados/{area_id}",
-        'municipio': f"https://servicodados.ibge.gov.br/api/v1/localidades/municipios/{area_id}"
-    }
-    
-    url = url_mapping.get(area_type)
-    if not url:
+    """Obtém nome da área geográfica (do índice de localidades, sem consulta por id)."""
+    if area_type not in ('region', 'uf', 'municipio'):
         return "Área desconhecida"
-    
-    data = get_cached_api_data(url)
-    return data['nome'] if data else "Nome não encontrado"
+
+    table = get_locality_table()
+    if table is None or table.level(area_id) != area_type:
+        return "Nome não encontrado"
+    return table.name(area_id)
@@ -0,0 +1,158 @@
+"""
+Gazetteer local dos municípios: nome ou código IBGE -> coordenadas.
+
+A coordenada de cada município é um ponto interno da sua geometria
+(representative_point, sempre dentro do polígono, ao contrário do
+centróide), calculado uma vez a partir da malha nacional de municípios,
+que fica em MALHA_CACHE como as demais. Os nomes vêm do índice de
+localidades e são comparados sem acentos nem diferença de maiúsculas, por
+tabela hash; nomes que existem em mais de uma UF só são resolvidos com a
+UF ("Bom Jesus - PI", "Bom Jesus/RS", "Bom Jesus (SC)").
+
+A coluna é resolvida por valor distinto (pd.factorize): mesmo colunas
+grandes fazem no máximo uma consulta à tabela por nome diferente, e nenhuma
+requisição por linha.
+"""
+import logging
+import re
+import threading
+from typing import Optional
+
+import cachetools
+import numpy as np
+import pandas as pd
+
+from coordinates import (
+    REASON_AMBIGUOUS, REASON_MISSING, REASON_NOT_FOUND, REASON_OK, CleanedCoordinates
+)
+from data_utils import get_locality_table
+from localities import LocalityTable, fold_name
+from map_utils import MALHA_MUNICIPIOS_BR_URL, generate_specific_map
+from metrics import record_cache, span
+
+logger = logging.getLogger(__name__)
+
+# Gazetteer montado a partir da malha e do índice de localidades (1 hora)
+GAZETTEER_CACHE = cachetools.TTLCache(maxsize=1, ttl=3600)
+_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+# Nome seguido da sigla da UF: "Nome - UF", "Nome/UF", "Nome, UF", "Nome (UF)"
+_UF_SUFFIX = re.compile(r'^(.*?)\s*(?:[-/,]\s*|\(\s*)([A-Za-z]{2})\s*\)?$')
+
+# Resultados da resolução além das linhas da tabela
+_NOT_FOUND = -1
+_AMBIGUOUS = -2
+_MISSING = -3
+
+def name_key(name: str) -> str:
+    """Chave de comparação de nomes: sem acentos, minúsculas e espaços simples."""
+    return ' '.join(fold_name(name).split())
+
+class Gazetteer:
+    """Coordenadas dos municípios, consultadas por nome ou código IBGE."""
+
+    def __init__(self, table: LocalityTable, gdf_municipios):
+        ids = table.municipio_ids
+        self.latitudes = np.full(len(ids), np.nan)
+        self.longitudes = np.full(len(ids), np.nan)
+
+        # Ponto interno de cada feição, na linha do município na tabela
+        points = gdf_municipios.geometry.representative_point()
+        codes = pd.to_numeric(gdf_municipios['codarea'], errors='coerce')
+        rows = pd.Series(np.arange(len(ids)), index=ids).reindex(codes).to_numpy()
+        found = ~np.isnan(rows)
+        self.latitudes[rows[found].astype(int)] = points.y.to_numpy()[found]
+        self.longitudes[rows[found].astype(int)] = points.x.to_numpy()[found]
+
+        # Códigos com 7 dígitos e também sem o dígito verificador (6 dígitos)
+        self._by_code = {}
+        for row, code in enumerate(ids.tolist()):
+            self._by_code[code] = row
+            self._by_code[code // 10] = row
+
+        siglas = dict(zip(table.uf_ids.tolist(), (s.upper() for s in table.uf_siglas)))
+        self._by_name = {}
+        self._by_name_uf = {}
+        for row, (name, uf_id) in enumerate(zip(table.municipio_names,
+                                                table.municipio_uf_ids.tolist())):
+            key = name_key(name)
+            self._by_name[key] = _AMBIGUOUS if key in self._by_name else row
+            self._by_name_uf[(key, siglas.get(uf_id, ''))] = row
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self.latitudes)))
+
+    def resolve(self, value) -> int:
+        """Linha do município para um nome ou código (ou um dos códigos _NOT_FOUND...)."""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return _MISSING
+        if isinstance(value, (int, np.integer)) or (isinstance(value, float) and value.is_integer()):
+            return self._by_code.get(int(value), _NOT_FOUND)
+
+        text = str(value).strip()
+        if not text:
+            return _MISSING
+        if text.isdigit():
+            return self._by_code.get(int(text), _NOT_FOUND)
+
+        row = self._by_name.get(name_key(text), _NOT_FOUND)
+        if row >= 0:
+            return row
+        match = _UF_SUFFIX.match(text)
+        if match:
+            with_uf = self._by_name_uf.get((name_key(match.group(1)), match.group(2).upper()))
+            if with_uf is not None:
+                return with_uf
+        return row
+
+    def geocode(self, values) -> CleanedCoordinates:
+        """Coordenadas de uma coluna de nomes ou códigos, com o motivo de cada linha."""
+        series = pd.Series(values, copy=False).reset_index(drop=True)
+        codes, uniques = pd.factorize(series)
+        # Uma resolução por valor distinto; a posição extra (-1) é a das células vazias
+        lookup = np.array([self.resolve(v) for v in uniques] + [_MISSING], dtype=np.int64)
+        rows = lookup[codes]
+
+        found = rows >= 0
+        safe_rows = np.where(found, rows, 0)
+        latitudes = np.where(found, self.latitudes[safe_rows], np.nan)
+        longitudes = np.where(found, self.longitudes[safe_rows], np.nan)
+
+        reasons = np.full(len(rows), REASON_OK, dtype=np.uint8)
+        reasons[(rows == _NOT_FOUND) | (found & np.isnan(latitudes))] = REASON_NOT_FOUND
+        reasons[rows == _AMBIGUOUS] = REASON_AMBIGUOUS
+        reasons[rows == _MISSING] = REASON_MISSING
+        return CleanedCoordinates(latitudes, longitudes, reasons)
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Gazetteer dos municípios, montado uma vez por processo (e renovado a cada hora)."""
+    with _cache_lock:
+        gazetteer = GAZETTEER_CACHE.get('municipios')
+    record_cache('gazetteer', gazetteer is not None)
+    if gazetteer is not None:
+        return gazetteer
+
+    with _lock:
+        with _cache_lock:
+            gazetteer = GAZETTEER_CACHE.get('municipios')
+        if gazetteer is not None:
+            return gazetteer
+        table = get_locality_table()
+        gdf, error = generate_specific_map(MALHA_MUNICIPIOS_BR_URL)
+        if table is None or error:
+            logger.error(f"Gazetteer indisponível: {error or 'sem tabela de localidades'}")
+            return None
+        with span('gazetteer'):
+            gazetteer = Gazetteer(table, gdf)
+        with _cache_lock:
+            GAZETTEER_CACHE['municipios'] = gazetteer
+        logger.info(f"Gazetteer montado: {len(gazetteer)} municípios com coordenadas")
+        return gazetteer
+
+def geocode_municipios(values) -> Optional[CleanedCoordinates]:
+    """Resolve uma coluna de nomes ou códigos IBGE de municípios em coordenadas."""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.geocode(values)
@@ -0,0 +1,107 @@
+"""
+Armazenamento das imagens geradas, servidas por URL em vez de data URI.
+
+As imagens são gravadas em disco com o hash do conteúdo como nome, de modo
+que todos os workers do gunicorn enxergam as mesmas imagens e a URL pode
+ser cacheada indefinidamente pelo navegador (o conteúdo nunca muda).
+
+A URL também fica guardada por chave de parâmetros (área, estilo e
+camadas), para que uma combinação já renderizada não seja desenhada de novo.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Hashable, Optional
+
+import cachetools
+
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.environ.get('PYMAPS_IMAGE_DIR',
+                           os.path.join(tempfile.gettempdir(), 'pymaps-mapas'))
+MAX_IMAGES = int(os.environ.get('PYMAPS_IMAGE_STORE_MAX', 500))
+IMAGE_ROUTE = '/mapas/'
+
+MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# URL da imagem por chave de parâmetros da renderização (1 hora)
+URL_CACHE = cachetools.TTLCache(maxsize=1024, ttl=3600)
+_lock = threading.Lock()
+
+def _path(name: str) -> str:
+    return os.path.join(IMAGE_DIR, os.path.basename(name))
+
+def _prune():
+    """Remove as imagens mais antigas quando o diretório passa do limite."""
+    try:
+        entries = [e for e in os.scandir(IMAGE_DIR) if e.is_file()]
+        if len(entries) <= MAX_IMAGES:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - MAX_IMAGES]:
+            os.remove(entry.path)
+    except OSError as e:
+        logger.warning(f"Erro ao limpar imagens antigas: {e}")
+
+def store_image(content: bytes, format: str = 'png',
+                params_key: Optional[Hashable] = None) -> str:
+    """
+    Grava a imagem (se ainda não existir) e retorna a URL para servi-la.
+    Com params_key, a URL fica disponível em cached_image_url.
+    """
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    name = f"{hashlib.sha256(content).hexdigest()[:32]}.{format}"
+    path = _path(name)
+    if not os.path.exists(path):
+        # Grava em arquivo temporário e renomeia: leitores nunca veem arquivo parcial
+        fd, tmp_path = tempfile.mkstemp(dir=IMAGE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        _prune()
+    url = IMAGE_ROUTE + name
+    if params_key is not None:
+        with _lock:
+            URL_CACHE[params_key] = url
+    return url
+
+def cached_image_url(params_key: Hashable) -> Optional[str]:
+    """URL de uma imagem já gerada com os mesmos parâmetros, se ainda estiver em disco."""
+    with _lock:
+        url = URL_CACHE.get(params_key)
+    if url is not None and not os.path.exists(_path(url[len(IMAGE_ROUTE):])):
+        # Removida pela limpeza do diretório
+        with _lock:
+            URL_CACHE.pop(params_key, None)
+        url = None
+    record_cache('imagens_geradas', url is not None)
+    return url
+
+def load_image(url: str) -> Optional[bytes]:
+    """Lê a imagem a partir da URL retornada por store_image."""
+    if not url or not url.startswith(IMAGE_ROUTE):
+        return None
+    try:
+        with open(_path(url[len(IMAGE_ROUTE):]), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def init_app(server):
+    """Registra a rota que serve as imagens, com cache HTTP de longo prazo."""
+    from flask import abort, send_file
+
+    @server.route(IMAGE_ROUTE + '<name>')
+    def serve_map_image(name):
+        path = _path(name)
+        format = name.rsplit('.', 1)[-1]
+        if format not in MIMETYPES or not os.path.exists(path):
+            abort(404)
+        response = send_file(path, mimetype=MIMETYPES[format], conditional=True,
+                             etag=name.rsplit('.', 1)[0], max_age=31536000)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
@@ -0,0 +1,92 @@
+"""
+Pilha de camadas de pontos sobrepostas a um mapa.
+
+Cada camada guarda suas coordenadas e seu estilo. Os pontos filtrados pela
+área são mantidos em cache por (conteúdo da camada, área), de modo que
+adicionar ou reestilizar uma camada só filtra aquela camada; as demais, a
+malha base (MALHA_CACHE) e a união da área (AREA_UNION_CACHE) são
+reaproveitadas.
+"""
+import dataclasses
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+
+import cachetools
+import numpy as np
+
+from map_utils import PointLayer, filter_points_by_area
+from metrics import record_cache
+
+# Pontos já filtrados por (camada, área) (1 hora)
+FILTERED_POINTS_CACHE = cachetools.TTLCache(maxsize=256, ttl=3600)
+_lock = threading.Lock()
+
+# Campos de estilo das camadas (mudá-los não refiltra os pontos)
+STYLE_FIELDS = ('name', 'marker_style', 'color', 'size', 'marker_image')
+
+def coordinates_key(latitudes, longitudes) -> str:
+    """Hash do conteúdo das coordenadas de uma camada."""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(latitudes, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(longitudes, dtype=float).tobytes())
+    return digest.hexdigest()
+
+def layer_from_dict(spec: Dict) -> PointLayer:
+    """Reconstrói a camada a partir do conteúdo de um dcc.Store."""
+    return PointLayer(**{field.name: spec.get(field.name)
+                         for field in dataclasses.fields(PointLayer)
+                         if field.name in spec})
+
+class LayerStack:
+    """Camadas de pontos sobre uma área, filtradas uma única vez por área."""
+
+    def __init__(self, gdf_area, area_key):
+        self.gdf_area = gdf_area
+        self.area_key = area_key
+        self._layers: List[PointLayer] = []
+        self._keys: List[str] = []
+
+    @classmethod
+    def from_dicts(cls, gdf_area, area_key, specs: List[Dict]) -> 'LayerStack':
+        stack = cls(gdf_area, area_key)
+        for spec in specs or []:
+            stack.add(layer_from_dict(spec))
+        return stack
+
+    def __len__(self):
+        return len(self._layers)
+
+    def add(self, layer: PointLayer) -> int:
+        """Adiciona a camada ao topo da pilha (filtrada sob demanda, com cache)."""
+        self._layers.append(layer)
+        self._keys.append(coordinates_key(layer.latitudes, layer.longitudes))
+        return len(self._layers) - 1
+
+    def _filtered(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        key = (self._keys[index], self.area_key)
+        with _lock:
+            points = FILTERED_POINTS_CACHE.get(key)
+        record_cache('pontos_filtrados', points is not None)
+        if points is None:
+            layer = self._layers[index]
+            points = filter_points_by_area(
+                layer.latitudes, layer.longitudes, self.gdf_area, self.area_key
+            )
+            with _lock:
+                FILTERED_POINTS_CACHE[key] = points
+        return points
+
+    def state_key(self) -> Tuple:
+        """Conteúdo e estilo de todas as camadas, na ordem da pilha."""
+        return tuple((key,) + tuple(getattr(layer, field) for field in STYLE_FIELDS)
+                     for key, layer in zip(self._keys, self._layers))
+
+    def visible_layers(self) -> List[PointLayer]:
+        """Camadas com as coordenadas já recortadas pela área, na ordem da pilha."""
+        visible = []
+        for index, layer in enumerate(self._layers):
+            latitudes, longitudes = self._filtered(index)
+            visible.append(dataclasses.replace(layer, latitudes=latitudes,
+                                               longitudes=longitudes))
+        return visible
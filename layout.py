@@ -1,6 +1,7 @@
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 from data_utils import get_regions, get_all_municipios
+from projection import PROJECTIONS, DEFAULT_CRS
 
 # Componentes reutilizáveis
 def create_error_alert(id_name):
@@ -140,6 +141,12 @@ app_layout = html.Div(className='dashboard-container', children=[
                                     placeholder='Longitude',
                                     className='mb-2'
                                 ),
+                                html.Label("Ou coluna do município (nome ou código IBGE)"),
+                                dcc.Dropdown(
+                                    id='municipio-column',
+                                    placeholder='Município',
+                                    className='mb-2'
+                                ),
                             ]),
                             
                             html.Div([
@@ -192,11 +199,31 @@ app_layout = html.Div(className='dashboard-container', children=[
                             ]),
                             
                             dbc.Button(
-                                'Adicionar pontos ao mapa',
+                                'Adicionar camada ao mapa',
                                 id='add-points-button',
                                 color='success',
-                                className='w-100'
-                            )
+                                className='w-100 mb-3'
+                            ),
+                            
+                            html.Div([
+                                html.Label("Camada ativa (recebe as alterações de estilo; "
+                                           "sem camada, o estilo vale para a próxima)"),
+                                dcc.Dropdown(
+                                    id='active-layer-dropdown',
+                                    placeholder='Nenhuma camada',
+                                    clearable=True,
+                                    className='mb-2'
+                                ),
+                                dbc.Button(
+                                    'Remover todas as camadas',
+                                    id='clear-layers-button',
+                                    color='danger',
+                                    outline=True,
+                                    className='w-100'
+                                ),
+                                dcc.Store(id='layers-store', data=[]),
+                                dcc.Store(id='layer-styles', data={}),
+                            ])
                         ],
                         title="📊 Adicione seus dados",
                     ),
@@ -245,6 +272,7 @@ app_layout = html.Div(className='dashboard-container', children=[
                                 max=5.0,
                                 step=0.5,
                                 value=1.0,
+                                updatemode='mouseup',
                                 className='mb-3'
                             ),
                             
@@ -255,6 +283,29 @@ app_layout = html.Div(className='dashboard-container', children=[
                                 max=10,
                                 step=0.5,
                                 value=0.5,
+                                updatemode='mouseup',
+                                className='mb-3'
+                            ),
+                            
+                            html.Label("Modo do mapa"),
+                            dbc.RadioItems(
+                                id='map-mode',
+                                options=[
+                                    {'label': 'Imagem (servidor)', 'value': 'imagem'},
+                                    {'label': 'Vetorial (interativo)', 'value': 'vetorial'}
+                                ],
+                                value='imagem',
+                                inline=True,
+                                className='mb-3'
+                            ),
+                            
+                            html.Label("Projeção"),
+                            dcc.Dropdown(
+                                id='projection-dropdown',
+                                options=[{'label': label, 'value': crs}
+                                         for crs, label in PROJECTIONS.items()],
+                                value=DEFAULT_CRS,
+                                clearable=False,
                                 className='mb-3'
                             ),
                             
@@ -355,13 +406,22 @@ app_layout = html.Div(className='dashboard-container', children=[
             dbc.Col([
                 dbc.Card([
                     dbc.CardBody([
-                        dcc.Loading(
-                            html.Div([
-                                html.Img(id='mapa', className="img-fluid")
-                            ], className="map-container"),
-                            type="default",
-                            color="#044c6d"
+                        # Sem dcc.Loading: o preview e o indicador de carregamento
+                        # ficam a cargo de assets/map_preview.js
+                        html.Div([
+                            html.Img(id='mapa', className="img-fluid")
+                        ], id='map-container', className="map-container"),
+                        # Modo vetorial: figura montada no navegador (assets/map_vector.js)
+                        dcc.Graph(
+                            id='mapa-vetorial',
+                            config={'displaylogo': False, 'scrollZoom': True},
+                            style={'display': 'none'}
                         ),
+                        dcc.Store(id='vector-data'),
+                        dcc.Store(id='map-style'),
+                        dcc.Store(id='layers-render'),
+                        dcc.Store(id='map-render-state'),
+                        dcc.Store(id='session-id', storage_type='session'),
                         dbc.Button(
                             "BAIXAR MAPA",
                             id='download-map-link',
@@ -0,0 +1,163 @@
+"""
+Tabela compacta das localidades do IBGE (regiões, UFs e municípios).
+
+Montada uma única vez a partir das listas completas da API: os ids ficam em
+arrays int32, os nomes são internados e cada município guarda apenas os ids
+da sua UF e região, sem a hierarquia aninhada (microrregião, mesorregião)
+do JSON original. Os municípios são ordenados por UF e nome, de modo que os
+de cada UF ocupam uma fatia contígua, e as opções dos dropdowns são
+montadas na construção e reaproveitadas em todas as chamadas.
+
+A tabela também é o índice hierárquico das localidades: para qualquer id
+(os códigos do IBGE não se repetem entre níveis) responde nome, nível, pai
+e filhos em memória, sem consultas à API por id.
+"""
+import sys
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Níveis da hierarquia, com os mesmos nomes de area_type usados no app
+REGION, UF, MUNICIPIO = 'region', 'uf', 'municipio'
+
+def fold_name(name: str) -> str:
+    """Nome sem acentos e em minúsculas, para ordenação e busca."""
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def municipio_uf(municipio: Dict) -> Optional[Dict]:
+    """
+    UF do município no JSON do IBGE. Municípios recentes podem vir sem
+    microrregião; nesse caso a UF vem da região imediata.
+    """
+    micro = municipio.get('microrregiao')
+    if micro and micro.get('mesorregiao'):
+        return micro['mesorregiao'].get('UF')
+    imediata = municipio.get('regiao-imediata')
+    if imediata and imediata.get('regiao-intermediaria'):
+        return imediata['regiao-intermediaria'].get('UF')
+    return None
+
+def _options(ids, names) -> List[Dict]:
+    return [{'label': name, 'value': int(i)} for i, name in zip(ids, names)]
+
+class LocalityTable:
+    """Regiões, UFs e municípios em arrays, com fatias de municípios por UF."""
+
+    def __init__(self, regions: List[Dict], ufs: List[Dict], municipios: List[Dict]):
+        intern = sys.intern
+
+        self.region_ids = np.array([r['id'] for r in regions], dtype=np.int32)
+        self.region_names = tuple(intern(r['nome']) for r in regions)
+
+        self.uf_ids = np.array([u['id'] for u in ufs], dtype=np.int32)
+        self.uf_names = tuple(intern(u['nome']) for u in ufs)
+        self.uf_siglas = tuple(intern(u.get('sigla', '')) for u in ufs)
+        self.uf_region_ids = np.array([u['regiao']['id'] for u in ufs], dtype=np.int32)
+
+        rows = []
+        for m in municipios:
+            uf = municipio_uf(m)
+            if uf is None:
+                continue
+            rows.append((uf['id'], fold_name(m['nome']), m['id'], intern(m['nome'])))
+        rows.sort()
+
+        self.municipio_ids = np.array([row[2] for row in rows], dtype=np.int32)
+        self.municipio_names = tuple(row[3] for row in rows)
+        self.municipio_uf_ids = np.array([row[0] for row in rows], dtype=np.int32)
+        region_of_uf = dict(zip(self.uf_ids.tolist(), self.uf_region_ids.tolist()))
+        self.municipio_region_ids = np.array(
+            [region_of_uf.get(uf_id, 0) for uf_id in self.municipio_uf_ids.tolist()],
+            dtype=np.int32
+        )
+
+        # Posição de cada id nos arrays
+        self._region_rows = {int(i): row for row, i in enumerate(self.region_ids)}
+        self._uf_rows = {int(i): row for row, i in enumerate(self.uf_ids)}
+        self._municipio_rows = {int(i): row for row, i in enumerate(self.municipio_ids)}
+
+        # Fatia contígua dos municípios de cada UF
+        uf_values, starts, counts = np.unique(self.municipio_uf_ids, return_index=True,
+                                              return_counts=True)
+        self._uf_slices = {int(uf_id): slice(int(start), int(start + count))
+                           for uf_id, start, count in zip(uf_values, starts, counts)}
+
+        # Opções dos dropdowns
+        self.region_options = _options(self.region_ids, self.region_names)
+        self.uf_options = _options(self.uf_ids, self.uf_names)
+        by_name = sorted(range(len(rows)), key=lambda row: rows[row][1])
+        self.municipio_options = [{'label': self.municipio_names[row],
+                                   'value': int(self.municipio_ids[row])} for row in by_name]
+        self._uf_municipio_options = {
+            uf_id: _options(self.municipio_ids[rows_slice], self.municipio_names[rows_slice])
+            for uf_id, rows_slice in self._uf_slices.items()
+        }
+        self._region_uf_options = {int(region_id): [] for region_id in self.region_ids}
+        for option, region_id in zip(self.uf_options, self.uf_region_ids.tolist()):
+            self._region_uf_options.setdefault(region_id, []).append(option)
+
+    def __len__(self):
+        return len(self.municipio_ids)
+
+    def ufs_of_region(self, region_id: int) -> List[Dict]:
+        """Opções das UFs da região."""
+        return self._region_uf_options.get(int(region_id), [])
+
+    def municipios_of_uf(self, uf_id: int) -> List[Dict]:
+        """Opções dos municípios da UF, em ordem alfabética."""
+        return self._uf_municipio_options.get(int(uf_id), [])
+
+    def region_name(self, region_id: int) -> Optional[str]:
+        row = self._region_rows.get(int(region_id))
+        return None if row is None else self.region_names[row]
+
+    def uf_name(self, uf_id: int) -> Optional[str]:
+        row = self._uf_rows.get(int(uf_id))
+        return None if row is None else self.uf_names[row]
+
+    def municipio_name(self, municipio_id: int) -> Optional[str]:
+        row = self._municipio_rows.get(int(municipio_id))
+        return None if row is None else self.municipio_names[row]
+
+    def level(self, area_id: int) -> Optional[str]:
+        """Nível da localidade: 'region', 'uf' ou 'municipio' (None se desconhecida)."""
+        area_id = int(area_id)
+        if area_id in self._municipio_rows:
+            return MUNICIPIO
+        if area_id in self._uf_rows:
+            return UF
+        if area_id in self._region_rows:
+            return REGION
+        return None
+
+    def name(self, area_id: int) -> Optional[str]:
+        """Nome de qualquer localidade."""
+        lookup = {
+            REGION: self.region_name,
+            UF: self.uf_name,
+            MUNICIPIO: self.municipio_name,
+        }.get(self.level(area_id))
+        return lookup(area_id) if lookup else None
+
+    def parent(self, area_id: int) -> Optional[int]:
+        """Id do nível acima: UF do município, região da UF (None para regiões)."""
+        area_id = int(area_id)
+        row = self._municipio_rows.get(area_id)
+        if row is not None:
+            return int(self.municipio_uf_ids[row])
+        row = self._uf_rows.get(area_id)
+        if row is not None:
+            return int(self.uf_region_ids[row])
+        return None
+
+    def children(self, area_id: int) -> List[int]:
+        """Ids do nível abaixo: UFs da região, municípios da UF."""
+        area_id = int(area_id)
+        if area_id in self._region_rows:
+            return self.uf_ids[self.uf_region_ids == area_id].tolist()
+        rows = self._uf_slices.get(area_id)
+        if rows is not None:
+            return self.municipio_ids[rows].tolist()
+        return []
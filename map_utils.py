@@ -1,18 +1,32 @@
 # from altair import Point
-from shapely.geometry import Point, shape, mapping
-import requests
+from shapely.geometry import shape, mapping
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import geopandas as gpd
 import io
+import os
 import base64
 import logging
+import threading
 import traceback
+import cachetools
+import shapely
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from matplotlib.patches import Patch, Rectangle
 from matplotlib.lines import Line2D
-from data_utils import get_area_name
+from matplotlib.legend_handler import HandlerBase
+from matplotlib.image import BboxImage
+from matplotlib.transforms import Bbox, TransformedBbox
+from dataclasses import dataclass
+from typing import Optional
+import async_io
+from data_utils import get_area_name, IBGE_API_URL
+from metrics import record_cache, span
+from projection import project_area, project_points
+from rendering import (
+    COMPASS_LABEL, COMPASS_RECT, FIGURE_DPI, FigureTemplate, decode_data_uri,
+    RenderCancelled, load_asset, render_context, template_key
+)
 from PIL import Image
 import numpy as np
 
@@ -63,19 +77,75 @@ def optimize_marker_image(image_data):
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Cache das malhas do IBGE já convertidas em GeoDataFrame (1 hora)
+MALHA_CACHE = cachetools.TTLCache(maxsize=64, ttl=3600)
+
+# Codificação da imagem: resolução, nível de compressão zlib do PNG (0-9) e
+# número de cores da paleta (0 = sem quantização)
+RENDER_DPI = FIGURE_DPI
+PNG_COMPRESS_LEVEL = int(os.environ.get('PYMAPS_PNG_COMPRESS_LEVEL', 6))
+PNG_PALETTE_COLORS = int(os.environ.get('PYMAPS_PNG_PALETTE_COLORS', 256))
+
+# Zoom dos ícones de marcador (imagem enviada), multiplicado pelo tamanho da
+# camada. Independe da extensão e da projeção do mapa.
+MARKER_ICON_ZOOM = 0.4
+
+# Margem em volta da área útil, como no bbox_inches='tight' do matplotlib
+TIGHT_PAD_INCHES = 0.1
+
+# Área útil (tight bbox) por layout de figura
+TIGHT_BBOX_CACHE = cachetools.LRUCache(maxsize=256)
+
+# União (dissolve) das geometrias de cada área, preparada para os testes de ponto (1 hora)
+AREA_UNION_CACHE = cachetools.TTLCache(maxsize=64, ttl=3600)
+
+# Os caches do cachetools não são thread-safe (várias threads por worker)
+_cache_lock = threading.Lock()
+
+# Tempo limite das requisições de malha (a do Brasil por município tem vários MB)
+MALHA_TIMEOUT = float(os.environ.get('PYMAPS_MALHA_TIMEOUT', 60))
+
+# URLs das malhas por tipo de área
+MALHA_URLS = {
+    'region': IBGE_API_URL + "/v3/malhas/regioes/{area_id}?intrarregiao=UF&formato=application/vnd.geo+json",
+    'uf': IBGE_API_URL + "/v3/malhas/estados/{area_id}?intrarregiao=municipio&formato=application/vnd.geo+json",
+    'municipio': IBGE_API_URL + "/v3/malhas/municipios/{area_id}?formato=application/vnd.geo+json"
+}
+
+# Malha de todos os municípios em qualidade mínima (base do gazetteer)
+MALHA_MUNICIPIOS_BR_URL = (IBGE_API_URL + "/v3/malhas/paises/BR?intrarregiao=municipio"
+                           "&qualidade=minima&formato=application/vnd.geo+json")
+
+def request_malha(url):
+    """
+    Requisita uma malha ao IBGE pelo loop de async_io (que registra a
+    latência e coalesce pedidos simultâneos da mesma malha).
+    """
+    with span('fetch_malha'):
+        return async_io.fetch_json(url, MALHA_TIMEOUT)
+
 def get_base_map():
     """Obtém o mapa base do Brasil."""
     try:
-        url_br = "https://servicodados.ibge.gov.br/api/v3/malhas/paises/BR?intrarregiao=UF&formato=application/vnd.geo+json"
+        url_br = f"{IBGE_API_URL}/v3/malhas/paises/BR?intrarregiao=UF&formato=application/vnd.geo+json"
+        with _cache_lock:
+            gdf_br = MALHA_CACHE.get(url_br)
+        record_cache('malha', gdf_br is not None)
+        if gdf_br is not None:
+            return gdf_br, None
+
         logger.info(f"Requisitando mapa base: {url_br}")
         
-        response = requests.get(url_br)
-        if response.status_code != 200:
-            logger.error(f"Erro ao carregar mapa base. Status: {response.status_code}")
+        status, data_br = request_malha(url_br)
+        if status != 200:
+            logger.error(f"Erro ao carregar mapa base. Status: {status}")
             return None, "Erro ao carregar o mapa. Tente novamente mais tarde."
             
-        data_br = response.json()
-        gdf_br = gpd.GeoDataFrame.from_features(data_br['features'])
+        with span('geodataframe'):
+            gdf_br = gpd.GeoDataFrame.from_features(data_br['features'])
+            gdf_br.set_crs("EPSG:4326", inplace=True)
+        with _cache_lock:
+            MALHA_CACHE[url_br] = gdf_br
         return gdf_br, None
         
     except Exception as e:
@@ -83,85 +153,220 @@ def get_base_map():
         traceback.print_exc()
         return None, "Erro ao processar dados do mapa."
 
-def generate_base_map(gdf, color_map='#044c6d', color_border='#ffffff', border_thickness=1, show_axes=False):
-    """Gera um mapa base com as configurações especificadas."""
+def base_map_key(area_key, color_map='#044c6d', color_border='#ffffff', border_thickness=1,
+                 crs=None):
+    """Chave da malha desenhada: área, projeção e estilo das bordas (None se a área não tem chave)."""
+    if area_key is None:
+        return None
+    return (tuple(area_key), color_map, color_border, border_thickness, crs)
+
+@span('polygon_plot')
+def generate_base_map(gdf, color_map='#044c6d', color_border='#ffffff', border_thickness=1,
+                      show_axes=False, show_legend=True, show_compass=True, template=None,
+                      base_key=None):
+    """
+    Gera um mapa base com as configurações especificadas. Com template (de
+    render_context), desenha sobre o modelo emprestado; sem ele, monta uma
+    figura avulsa. Se o modelo já tem a malha base_key desenhada, ela é
+    reaproveitada.
+    """
     try:
-        fig, ax = plt.subplots(figsize=(15, 15), dpi=300)
-        
-        if border_thickness == 0:
-            gdf.plot(ax=ax, color=color_map, edgecolor='none')
-        else:
-            gdf.plot(ax=ax, color=color_map, edgecolor=color_border, linewidth=border_thickness)
-            
-        if not show_axes:
-            ax.set_axis_off()
-        
-        legend_ax = fig.add_axes([0.90, 0.15, 0.15, 0.70])
-        legend_ax.set_axis_off()
+        if template is None:
+            template = FigureTemplate(template_key(show_axes, show_legend, show_compass))
+        fig, ax = template.fig, template.ax
+
+        reuse = base_key is not None and template.base_key == base_key
+        record_cache('malhas_desenhadas', reuse)
+        if not reuse:
+            template.reset(keep_base=False)
+            if border_thickness == 0:
+                gdf.plot(ax=ax, color=color_map, edgecolor='none')
+            else:
+                gdf.plot(ax=ax, color=color_map, edgecolor=color_border, linewidth=border_thickness)
+            if base_key is not None:
+                template.mark_base(base_key)
         
-        return fig, ax, legend_ax
+        return fig, ax, template.legend_ax
         
     except Exception as e:
         logger.error(f"Erro ao gerar mapa base: {str(e)}")
         traceback.print_exc()
         return None, None, None
 
-def save_fig_to_buffer(fig):
+def map_layout_key(gdf, area_name, show_axes=False, show_legend=True, show_compass=True,
+                   border_thickness=1, layers=(), crs=None):
+    """Chave do layout da figura: tudo o que altera a área útil (tight bbox) da imagem."""
+    return (tuple(np.round(gdf.total_bounds, 6)), area_name, bool(show_axes),
+            bool(show_legend), bool(show_compass), border_thickness,
+            tuple((layer.name, bool(layer.marker_image)) for layer in layers), crs)
+
+def get_tight_bbox(fig, extent_key=None):
+    """
+    Área útil da figura, em polegadas, calculada sem desenhá-la. Com
+    extent_key, o resultado fica em cache para as próximas figuras com o
+    mesmo layout.
+    """
+    if extent_key is not None:
+        with _cache_lock:
+            bbox = TIGHT_BBOX_CACHE.get(extent_key)
+        if bbox is not None:
+            record_cache('extents', True)
+            return bbox
+
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(TIGHT_PAD_INCHES)
+    if extent_key is not None:
+        record_cache('extents', False)
+        with _cache_lock:
+            TIGHT_BBOX_CACHE[extent_key] = bbox
+    return bbox
+
+def encode_png(rgba, compress_level=None, palette_colors=None):
+    """Codifica um array RGBA em PNG, com paleta opcional."""
+    compress_level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+    palette_colors = PNG_PALETTE_COLORS if palette_colors is None else palette_colors
+
+    img = Image.fromarray(rgba, 'RGBA')
+    if palette_colors:
+        # O fundo do mapa é opaco: a paleta é calculada sobre RGB
+        img = img.convert('RGB').quantize(colors=palette_colors, method=Image.FASTOCTREE)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=compress_level)
+    return buf.getvalue()
+
+@span('encode')
+def fig_to_bytes(fig, format='png', extent_key=None):
+    """
+    Renderiza a figura e retorna os bytes da imagem no formato pedido.
+    A figura é desenhada uma única vez, já recortada pela área útil; o PNG
+    é codificado pelo PIL com compressão e paleta configuráveis.
+    """
+    bbox = get_tight_bbox(fig, extent_key)
+    buf = io.BytesIO()
+    if format != 'png':
+        fig.savefig(buf, format=format, bbox_inches=bbox, dpi=RENDER_DPI)
+        return buf.getvalue()
+
+    fig.savefig(buf, format='rgba', bbox_inches=bbox, dpi=RENDER_DPI)
+    # O canvas guarda o renderer do último desenho, já com o tamanho recortado
+    renderer = getattr(fig.canvas, 'renderer', None)
+    width, height = (int(renderer.width), int(renderer.height)) if renderer else (0, 0)
+    if width * height * 4 != buf.getbuffer().nbytes:
+        # Dimensões inesperadas: volta ao caminho padrão do matplotlib
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches=bbox, dpi=RENDER_DPI)
+        return buf.getvalue()
+
+    rgba = np.frombuffer(buf.getbuffer(), dtype=np.uint8).reshape(height, width, 4)
+    return encode_png(rgba)
+
+def to_data_uri(content, format='png'):
+    """Converte os bytes da imagem em data URI."""
+    encoded_image = base64.b64encode(content).decode('ascii')
+    return f'data:image/{format};base64,{encoded_image}'
+
+def save_fig_to_buffer(fig, extent_key=None):
     """Salva a figura em um buffer e retorna como base64."""
     try:
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=300)
-        buf.seek(0)
-        encoded_image = base64.b64encode(buf.getvalue()).decode('ascii')
-        plt.close(fig)
-        return f'data:image/png;base64,{encoded_image}'
+        return to_data_uri(fig_to_bytes(fig, extent_key=extent_key))
         
     except Exception as e:
         logger.error(f"Erro ao salvar figura: {str(e)}")
         traceback.print_exc()
         return None
 
+def save_fig_to_file(fig, path, format=None, extent_key=None):
+    """Salva a figura diretamente em arquivo (PNG ou SVG), sem data URI."""
+    if format is None:
+        format = path.rsplit('.', 1)[-1].lower()
+    content = fig_to_bytes(fig, format=format, extent_key=extent_key)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return len(content)
+
+@dataclass
+class PointLayer:
+    """Camada de pontos: coordenadas e estilo de desenho."""
+    name: str
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    marker_style: Optional[str] = 'o'
+    color: str = '#f9b347'
+    size: float = 1.0
+    marker_image: Optional[str] = None
+
+    def __post_init__(self):
+        self.latitudes = np.asarray(self.latitudes, dtype=float)
+        self.longitudes = np.asarray(self.longitudes, dtype=float)
+
+class ImageLegendHandler(HandlerBase):
+    """Desenha a imagem do marcador dentro da entrada da legenda."""
+    def __init__(self, img):
+        super().__init__()
+        self.img = img
+
+    def create_artists(self, legend, orig_handle, xdescent, ydescent,
+                       width, height, fontsize, trans):
+        bbox = TransformedBbox(Bbox.from_bounds(xdescent, ydescent, width, height), trans)
+        image = BboxImage(bbox)
+        image.set_data(self.img)
+        self.update_prop(image, orig_handle, legend)
+        return [image]
+
+def decode_marker_image(marker_image):
+    """Decodifica a imagem do marcador (data URI) em array, com cache por conteúdo."""
+    return decode_data_uri(marker_image)
+
+@span('legend')
 def add_legend(legend_ax, area_name, marker_style=None, marker_color=None, layer_name=None, 
-               marker_image=None, color_map='#044c6d', show_legend=True, show_compass=True):
-    """Adiciona legenda ao mapa."""
+               marker_image=None, color_map='#044c6d', show_legend=True, show_compass=True,
+               layers=None):
+    """Adiciona legenda ao mapa, com uma entrada por camada de pontos."""
     if not show_legend:
         legend_ax.clear()
         legend_ax.set_axis_off()
         return
 
+    if layers is None:
+        layers = []
+        if marker_image or (marker_style and marker_color and layer_name):
+            layers.append(PointLayer(layer_name, [], [], marker_style,
+                                     marker_color, marker_image=marker_image))
+
     try:
         handles = []
         labels = []
+        handler_map = {}
         
         handles.append(Patch(facecolor=color_map, edgecolor='none'))
         labels.append(area_name)
         
-        if marker_image:
-            content_type, content_string = marker_image.split(',')
-            img_data = base64.b64decode(content_string)
-            img = plt.imread(io.BytesIO(img_data), format='png')
-            img_handle = Rectangle((0, 0), 1, 1, fc="none", ec="none")
-            labels.append(layer_name)
-            handles.append(img_handle)
-            
-            imagebox = OffsetImage(img, zoom=0.1)
-            ab = AnnotationBbox(imagebox, (0.5, 0.5), frameon=False, box_alignment=(0.5, 0.5))
-            legend_ax.add_artist(ab)
-        elif marker_style and marker_color and layer_name:
-            handles.append(Line2D([0], [0], marker=marker_style, color='w', 
-                                markerfacecolor=marker_color, markersize=10))
-            labels.append(layer_name)
+        for layer in layers:
+            if not layer.name:
+                continue
+            if layer.marker_image:
+                img_handle = Rectangle((0, 0), 1, 1, fc="none", ec="none")
+                handler_map[img_handle] = ImageLegendHandler(decode_marker_image(layer.marker_image))
+                handles.append(img_handle)
+            elif layer.marker_style and layer.color:
+                handles.append(Line2D([0], [0], marker=layer.marker_style, color='w', 
+                                    markerfacecolor=layer.color, markersize=10))
+            else:
+                continue
+            labels.append(layer.name)
         
         legend = legend_ax.legend(handles, labels, title='Legenda', loc='center',
                                 fontsize=14, frameon=True, fancybox=True,
-                                shadow=True, title_fontsize=14)
+                                shadow=True, title_fontsize=14,
+                                handler_map=handler_map)
         
-        if show_compass:
+        # Os modelos de figura já trazem a rosa dos ventos montada
+        has_compass = any(a.get_label() == COMPASS_LABEL for a in legend_ax.child_axes)
+        if show_compass and not has_compass:
             try:
-                compass_rose = plt.imread('assets/compass_rose.png')
-                compass_ax = legend_ax.inset_axes([0.3, 0.0, 0.5, 0.3], transform=legend_ax.transAxes)
-                compass_ax.imshow(compass_rose)
+                compass_ax = legend_ax.inset_axes(COMPASS_RECT, transform=legend_ax.transAxes)
+                compass_ax.imshow(load_asset('compass_rose.png'))
                 compass_ax.axis('off')
+                compass_ax.set_label(COMPASS_LABEL)
             except Exception as e:
                 logger.error(f"Erro ao adicionar rosa dos ventos: {str(e)}")
                 
@@ -169,36 +374,75 @@ def add_legend(legend_ax, area_name, marker_style=None, marker_color=None, layer
         logger.error(f"Erro ao adicionar legenda: {str(e)}")
         traceback.print_exc()
 
-def generate_specific_map(url):
-    """Gera mapa específico a partir de uma URL."""
-    try:
-        logger.info(f"Requisitando mapa: {url}")
-        response = requests.get(url)
+def malha_from_response(url, status, data):
+    """Monta o GeoDataFrame de uma resposta de malha e o guarda em MALHA_CACHE."""
+    if status != 200:
+        logger.error(f"Erro na requisição. Status: {status}")
+        return None, f"Erro ao carregar o mapa. Status: {status}"
         
-        if response.status_code != 200:
-            logger.error(f"Erro na requisição. Status: {response.status_code}")
-            return None, f"Erro ao carregar o mapa. Status: {response.status_code}"
-            
-        data = response.json()
-        if not data.get('features'):
-            logger.error("Dados recebidos não contêm features")
-            return None, "Dados do mapa inválidos"
-            
-        # Criar GeoDataFrame com CRS explícito
+    if not data or not data.get('features'):
+        logger.error("Dados recebidos não contêm features")
+        return None, "Dados do mapa inválidos"
+        
+    # Criar GeoDataFrame com CRS explícito
+    with span('geodataframe'):
         gdf = gpd.GeoDataFrame.from_features(data['features'])
         gdf.set_crs("EPSG:4326", inplace=True)
+    
+    if len(gdf) == 0:
+        logger.error("GeoDataFrame vazio")
+        return None, "Dados do mapa vazios"
         
-        if len(gdf) == 0:
-            logger.error("GeoDataFrame vazio")
-            return None, "Dados do mapa vazios"
-            
-        return gdf, None
+    with _cache_lock:
+        MALHA_CACHE[url] = gdf
+    return gdf, None
+
+def generate_specific_map(url):
+    """Gera mapa específico a partir de uma URL."""
+    try:
+        with _cache_lock:
+            gdf = MALHA_CACHE.get(url)
+        record_cache('malha', gdf is not None)
+        if gdf is not None:
+            return gdf, None
+
+        logger.info(f"Requisitando mapa: {url}")
+        status, data = request_malha(url)
+        return malha_from_response(url, status, data)
         
     except Exception as e:
         logger.error(f"Erro ao gerar mapa específico: {str(e)}")
         traceback.print_exc()
         return None, str(e)
 
+def fetch_malhas(urls):
+    """
+    Várias malhas de uma vez: as que não estão em MALHA_CACHE são buscadas
+    em paralelo pelo loop de async_io. Retorna {url: (gdf, erro)}.
+    """
+    results = {}
+    missing = []
+    for url in urls:
+        with _cache_lock:
+            gdf = MALHA_CACHE.get(url)
+        record_cache('malha', gdf is not None)
+        if gdf is not None:
+            results[url] = (gdf, None)
+        else:
+            missing.append(url)
+
+    if missing:
+        logger.info(f"Requisitando {len(missing)} malhas")
+        with span('fetch_malha'):
+            responses = async_io.fetch_many(missing, MALHA_TIMEOUT)
+        for url, (status, data) in zip(missing, responses):
+            try:
+                results[url] = malha_from_response(url, status, data)
+            except Exception as e:
+                logger.error(f"Erro ao montar malha {url}: {str(e)}")
+                results[url] = (None, str(e))
+    return results
+
 def generate_brazil_map(color_map='#044c6d', color_border='#ffffff', border_thickness=1,
                        show_axes=False, show_legend=True, show_compass=True):
     """Gera mapa do Brasil."""
@@ -209,16 +453,12 @@ def generate_brazil_map(color_map='#044c6d', color_border='#ffffff', border_thic
         if error:
             return error, None
             
-        fig, ax, legend_ax = generate_base_map(gdf_br, color_map, color_border,
-                                             border_thickness, show_axes)
-                                             
-        if fig is None:
-            return None, None
-            
-        add_legend(legend_ax, 'Brasil', color_map=color_map,
-                  show_legend=show_legend, show_compass=show_compass)
-                  
-        return save_fig_to_buffer(fig), gdf_br
+        image = render_map_image(gdf_br, 'Brasil', color_map=color_map,
+                                 color_border=color_border,
+                                 border_thickness=border_thickness, show_axes=show_axes,
+                                 show_legend=show_legend, show_compass=show_compass,
+                                 area_key=('brasil', None))
+        return to_data_uri(image), gdf_br
         
     except Exception as e:
         logger.error(f"Erro ao gerar mapa do Brasil: {str(e)}")
@@ -229,23 +469,19 @@ def generate_region_map(region_id, color_map='#044c6d', color_border='#ffffff',
                        border_thickness=1, show_axes=False, show_legend=True, show_compass=True):
     """Gera mapa de região."""
     try:
-        url_region = f"https://servicodados.ibge.gov.br/api/v3/malhas/regioes/{region_id}?intrarregiao=UF&formato=application/vnd.geo+json"
+        url_region = MALHA_URLS['region'].format(area_id=region_id)
         gdf_region, error = generate_specific_map(url_region)
         
         if error:
             return error, None
             
-        fig, ax, legend_ax = generate_base_map(gdf_region, color_map, color_border,
-                                             border_thickness, show_axes)
-                                             
-        if fig is None:
-            return None, None
-            
         region_name = get_area_name('region', region_id)
-        add_legend(legend_ax, region_name, color_map=color_map,
-                  show_legend=show_legend, show_compass=show_compass)
-                  
-        return save_fig_to_buffer(fig), gdf_region
+        image = render_map_image(gdf_region, region_name, color_map=color_map,
+                                 color_border=color_border,
+                                 border_thickness=border_thickness, show_axes=show_axes,
+                                 show_legend=show_legend, show_compass=show_compass,
+                                 area_key=('region', region_id))
+        return to_data_uri(image), gdf_region
         
     except Exception as e:
         logger.error(f"Erro ao gerar mapa da região: {str(e)}")
@@ -257,23 +493,19 @@ def generate_uf_with_municipios_map(uf_id, color_map='#044c6d', color_border='#f
                                   show_compass=True):
     """Gera mapa de UF com municípios."""
     try:
-        url_uf = f"https://servicodados.ibge.gov.br/api/v3/malhas/estados/{uf_id}?intrarregiao=municipio&formato=application/vnd.geo+json"
+        url_uf = MALHA_URLS['uf'].format(area_id=uf_id)
         gdf_uf, error = generate_specific_map(url_uf)
         
         if error:
             return error, None
             
-        fig, ax, legend_ax = generate_base_map(gdf_uf, color_map, color_border,
-                                             border_thickness, show_axes)
-                                             
-        if fig is None:
-            return None, None
-            
         uf_name = get_area_name('uf', uf_id)
-        add_legend(legend_ax, uf_name, color_map=color_map,
-                  show_legend=show_legend, show_compass=show_compass)
-                  
-        return save_fig_to_buffer(fig), gdf_uf
+        image = render_map_image(gdf_uf, uf_name, color_map=color_map,
+                                 color_border=color_border,
+                                 border_thickness=border_thickness, show_axes=show_axes,
+                                 show_legend=show_legend, show_compass=show_compass,
+                                 area_key=('uf', uf_id))
+        return to_data_uri(image), gdf_uf
         
     except Exception as e:
         logger.error(f"Erro ao gerar mapa da UF: {str(e)}")
@@ -285,48 +517,59 @@ def generate_municipio_map(municipio_id, color_map='#044c6d', color_border='#fff
                          show_compass=True):
     """Gera mapa de município."""
     try:
-        url_municipio = f"https://servicodados.ibge.gov.br/api/v3/malhas/municipios/{municipio_id}?formato=application/vnd.geo+json"
+        url_municipio = MALHA_URLS['municipio'].format(area_id=municipio_id)
         gdf_municipio, error = generate_specific_map(url_municipio)
         
         if error:
             return error, None
             
-        fig, ax, legend_ax = generate_base_map(gdf_municipio, color_map, color_border,
-                                             border_thickness, show_axes)
-                                             
-        if fig is None:
-            return None, None
-            
         municipio_name = get_area_name('municipio', municipio_id)
-        add_legend(legend_ax, municipio_name, color_map=color_map,
-                  show_legend=show_legend, show_compass=show_compass)
-                  
-        return save_fig_to_buffer(fig), gdf_municipio
+        image = render_map_image(gdf_municipio, municipio_name, color_map=color_map,
+                                 color_border=color_border,
+                                 border_thickness=border_thickness, show_axes=show_axes,
+                                 show_legend=show_legend, show_compass=show_compass,
+                                 area_key=('municipio', municipio_id))
+        return to_data_uri(image), gdf_municipio
         
     except Exception as e:
         logger.error(f"Erro ao gerar mapa do município: {str(e)}")
         traceback.print_exc()
         return None, None
 
-def filter_points_by_area(latitudes, longitudes, gdf_area):
+def area_union(gdf_area, area_key=None):
+    """
+    Geometria única da área (dissolve), preparada para testes de ponto. Com
+    area_key, fica em cache para as próximas filtragens na mesma área.
+    """
+    if area_key is not None:
+        with _cache_lock:
+            union = AREA_UNION_CACHE.get(area_key)
+        if union is not None:
+            record_cache('uniao_area', True)
+            return union
+
+    with span('dissolve'):
+        union = gdf_area.unary_union
+        shapely.prepare(union)
+    if area_key is not None:
+        record_cache('uniao_area', False)
+        with _cache_lock:
+            AREA_UNION_CACHE[area_key] = union
+    return union
+
+def points_in_area(latitudes, longitudes, gdf_area, area_key=None):
+    """Máscara dos pontos dentro da área (teste vetorizado contra a união preparada)."""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    with span('point_filter'):
+        return shapely.contains_xy(area_union(gdf_area, area_key), longitudes, latitudes)
+
+def filter_points_by_area(latitudes, longitudes, gdf_area, area_key=None):
     """Filtra pontos pela área do mapa."""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
     try:
-        # Converter para arrays numpy se não forem
-        latitudes = np.array(latitudes)
-        longitudes = np.array(longitudes)
-        
-        # Criar pontos geométricos
-        points = [Point(float(lon), float(lat)) for lon, lat in zip(longitudes, latitudes)]
-        
-        # Criar GeoSeries com CRS definido (WGS84)
-        points_gdf = gpd.GeoSeries(points, crs="EPSG:4326")
-        
-        # Se gdf_area não tem CRS definido, definir como WGS84
-        if gdf_area.crs is None:
-            gdf_area.set_crs("EPSG:4326", inplace=True)
-            
-        # Filtrar pontos
-        mask = points_gdf.within(gdf_area.unary_union)
+        mask = points_in_area(latitudes, longitudes, gdf_area, area_key)
         return latitudes[mask], longitudes[mask]
         
     except Exception as e:
@@ -335,6 +578,107 @@ def filter_points_by_area(latitudes, longitudes, gdf_area):
         # Em caso de erro, retornar todos os pontos
         return latitudes, longitudes
 
+def get_area_map(area_type, area_id=None):
+    """Obtém GeoDataFrame e nome da área, reutilizando o cache das malhas."""
+    if area_type == 'brasil':
+        gdf, error = get_base_map()
+        return gdf, 'Brasil', error
+
+    url = MALHA_URLS.get(area_type)
+    if not url:
+        return None, None, f"Tipo de área desconhecido: {area_type}"
+
+    gdf, error = generate_specific_map(url.format(area_id=area_id))
+    if error:
+        return None, None, error
+    return gdf, get_area_name(area_type, area_id), None
+
+@span('points')
+def draw_point_layer(ax, gdf_base, layer, crs=None):
+    """Desenha uma camada de pontos no eixo do mapa, na projeção crs."""
+    if len(layer.latitudes) == 0:
+        return
+
+    x, y = project_points(layer.longitudes, layer.latitudes, crs)
+    if layer.marker_image:
+        img = decode_marker_image(layer.marker_image)
+        
+        # Zoom em pixels: o mesmo em qualquer área e projeção
+        icon_zoom = layer.size * MARKER_ICON_ZOOM  # Ajuste pelo slider
+        
+        for px, py in zip(x, y):
+            imagebox = OffsetImage(img, zoom=icon_zoom)
+            ab = AnnotationBbox(imagebox, (px, py), frameon=False,
+                              box_alignment=(0.5, 0.5),  # Centralizar
+                              pad=0)  # Sem padding
+            ax.add_artist(ab)
+    else:
+        ax.scatter(x, y, c=layer.color,
+                  s=(layer.size * 10)**2, marker=layer.marker_style)
+
+def build_map_figure(gdf_base, area_name, latitudes=None, longitudes=None,
+                     marker_style='o', color_map='#044c6d', color_border='#ffffff',
+                     color_marker='#f9b347', marker_size=1, border_thickness=1,
+                     show_axes=False, layer_name='Pontos', marker_image=None,
+                     show_legend=True, show_compass=True, layers=None, template=None,
+                     base_key=None, crs=None, area_key=None):
+    """
+    Monta a figura do mapa sem codificá-la. Os pontos podem vir como uma
+    única camada (latitudes/longitudes) ou como lista de PointLayer. Com crs,
+    malha e pontos são desenhados nessa projeção (a malha reprojetada fica em
+    cache por area_key).
+    """
+    gdf_base = project_area(gdf_base, crs, area_key)
+    fig, ax, legend_ax = generate_base_map(gdf_base, color_map, color_border,
+                                         border_thickness, show_axes,
+                                         show_legend, show_compass, template,
+                                         base_key)
+                                         
+    if fig is None:
+        return None
+
+    if layers is None:
+        layers = []
+        if latitudes is not None and longitudes is not None:
+            layers.append(PointLayer(layer_name, latitudes, longitudes, marker_style,
+                                     color_marker, marker_size, marker_image))
+
+    for layer in layers:
+        draw_point_layer(ax, gdf_base, layer, crs)
+    
+    add_legend(legend_ax, area_name, color_map=color_map,
+              show_legend=show_legend, show_compass=show_compass,
+              layers=layers)
+    return fig
+
+def render_map_image(gdf_base, area_name, layers=(), format='png', color_map='#044c6d',
+                     color_border='#ffffff', border_thickness=1, show_axes=False,
+                     show_legend=True, show_compass=True, area_key=None, is_stale=None,
+                     crs=None):
+    """
+    Renderiza o mapa com suas camadas e retorna os bytes da imagem. A figura
+    é emprestada por render_context, que a devolve mesmo em caso de erro.
+    Com area_key, a malha já desenhada em um modelo do pool é reaproveitada
+    e só os pontos e a legenda são refeitos. Se is_stale() for verdadeiro ao
+    obter a vaga de renderização, levanta RenderCancelled sem desenhar.
+    """
+    layers = list(layers)
+    extent_key = map_layout_key(gdf_base, area_name, show_axes, show_legend,
+                                show_compass, border_thickness, layers, crs)
+    base_key = base_map_key(area_key, color_map, color_border, border_thickness, crs)
+    with render_context(show_axes, show_legend, show_compass, base_key) as template:
+        if is_stale is not None and is_stale():
+            raise RenderCancelled("Pedido substituído por outro mais recente")
+        fig = build_map_figure(gdf_base, area_name, color_map=color_map,
+                               color_border=color_border,
+                               border_thickness=border_thickness, show_axes=show_axes,
+                               show_legend=show_legend, show_compass=show_compass,
+                               layers=layers, template=template, base_key=base_key,
+                               crs=crs, area_key=area_key)
+        if fig is None:
+            raise RuntimeError("Falha ao gerar figura do mapa")
+        return fig_to_bytes(fig, format, extent_key)
+
 def add_points_to_map(gdf_base, latitudes, longitudes, marker_style, color_map='#044c6d',
                      color_border='#ffffff', color_marker='#f9b347', marker_size=1,
                      border_thickness=1, show_axes=False, layer_name='Pontos',
@@ -342,40 +686,13 @@ def add_points_to_map(gdf_base, latitudes, longitudes, marker_style, color_map='
                      show_compass=True):
     """Adiciona pontos ao mapa."""
     try:
-        fig, ax, legend_ax = generate_base_map(gdf_base, color_map, color_border,
-                                             border_thickness, show_axes)
-                                             
-        if fig is None:
-            return None
-        
-        if marker_image:
-            content_type, content_string = marker_image.split(',')
-            img_data = base64.b64decode(content_string)
-            img = plt.imread(io.BytesIO(img_data), format='png')
-            
-            # Calcular zoom baseado no tamanho do mapa
-            bounds = gdf_base.total_bounds
-            map_width = bounds[2] - bounds[0]  # longitude
-            
-            # Ajustar zoom base no tamanho do mapa
-            base_zoom = map_width / 100  # Fator de escala base
-            icon_zoom = marker_size * base_zoom  # Ajuste pelo slider
-            
-            for lon, lat in zip(longitudes, latitudes):
-                imagebox = OffsetImage(img, zoom=icon_zoom)
-                ab = AnnotationBbox(imagebox, (lon, lat), frameon=False,
-                                  box_alignment=(0.5, 0.5),  # Centralizar
-                                  pad=0)  # Sem padding
-                ax.add_artist(ab)
-        elif len(latitudes) > 0 and len(longitudes) > 0:
-            ax.scatter(longitudes, latitudes, c=color_marker,
-                      s=(marker_size * 10)**2, marker=marker_style)
-        
-        add_legend(legend_ax, area_name, marker_style, color_marker,
-                  layer_name, marker_image, color_map=color_map,
-                  show_legend=show_legend, show_compass=show_compass)
-                  
-        return save_fig_to_buffer(fig)
+        layers = [PointLayer(layer_name, latitudes, longitudes, marker_style,
+                             color_marker, marker_size, marker_image)]
+        image = render_map_image(gdf_base, area_name, layers, color_map=color_map,
+                                 color_border=color_border,
+                                 border_thickness=border_thickness, show_axes=show_axes,
+                                 show_legend=show_legend, show_compass=show_compass)
+        return to_data_uri(image)
         
     except Exception as e:
         logger.error(f"Erro ao adicionar pontos ao mapa: {str(e)}")
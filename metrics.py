@@ -0,0 +1,189 @@
+"""
+Instrumentação: tempos por etapa, contadores de cache e latência do IBGE.
+
+As métricas ficam em memória, por processo (cada worker do gunicorn expõe
+as suas), e são publicadas no formato texto do Prometheus em /metrics.
+Os tempos das etapas de cada requisição também voltam no cabeçalho
+Server-Timing, visível nas ferramentas de desenvolvedor do navegador.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Envia o cabeçalho Server-Timing com os tempos de cada requisição
+TIMING_HEADER = os.environ.get('PYMAPS_TIMING_HEADER', '1') == '1'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_local = threading.local()
+REGISTRY = []
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return '{' + pairs + '}'
+
+class Counter:
+    """Contador monotônico com rótulos."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with _lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+class Histogram:
+    """Histograma cumulativo com rótulos, no modelo do Prometheus."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            # [contagens por faixa, soma, total de observações]
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with _lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames + ('le',), key + (bound,))
+                    lines.append(f'{self.name}_bucket{labels} {bucket_count}')
+                labels = _format_labels(self.labelnames + ('le',), key + ('+Inf',))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+STAGE_SECONDS = Histogram(
+    'pymaps_stage_seconds', 'Duração das etapas de geração do mapa.', ['stage']
+)
+CACHE_REQUESTS = Counter(
+    'pymaps_cache_requests_total', 'Consultas aos caches, por resultado (hit/miss).',
+    ['cache', 'result']
+)
+MAP_UPDATES = Counter(
+    'pymaps_map_updates_total', 'Atualizações do mapa, pela etapa invalidada pela entrada.',
+    ['stage']
+)
+COALESCED_UPDATES = Counter(
+    'pymaps_coalesced_updates_total',
+    'Atualizações do mapa descartadas por outra mais recente da mesma sessão.',
+    ['stage']
+)
+COALESCED_FETCHES = Counter(
+    'pymaps_coalesced_fetches_total',
+    'Requisições ao IBGE atendidas por outra idêntica já em andamento.'
+)
+UPSTREAM_SECONDS = Histogram(
+    'pymaps_upstream_seconds', 'Latência das requisições à API do IBGE.',
+    ['endpoint', 'status']
+)
+
+def record_cache(cache_name, hit):
+    """Conta um acerto ou falha de cache."""
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+def upstream_endpoint(url):
+    """Agrupa a URL do IBGE por serviço, para não explodir a cardinalidade."""
+    for endpoint in ('localidades', 'malhas'):
+        if f'/{endpoint}/' in url:
+            return endpoint
+    return 'outro'
+
+def observe_upstream(url, seconds, status):
+    UPSTREAM_SECONDS.observe(seconds, endpoint=upstream_endpoint(url), status=status)
+
+@contextmanager
+def span(stage):
+    """Mede a duração de uma etapa e a registra no histograma e na requisição."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+def start_request_spans():
+    """Começa a coletar as etapas da requisição atual (por thread)."""
+    _local.spans = []
+
+def pop_request_spans() -> List[Tuple[str, float]]:
+    spans = getattr(_local, 'spans', None) or []
+    _local.spans = None
+    return spans
+
+def server_timing_header(spans) -> str:
+    """Agrega as etapas repetidas e formata o cabeçalho Server-Timing (ms)."""
+    totals: Dict[str, float] = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in totals.items())
+
+def render_latest() -> str:
+    """Exposição no formato texto do Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+def init_app(server):
+    """Registra a rota /metrics e o cabeçalho Server-Timing no servidor Flask."""
+    from flask import Response, request
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+        return Response(render_latest(), mimetype='text/plain; version=0.0.4')
+
+    @server.before_request
+    def _start_spans():
+        start_request_spans()
+
+    @server.after_request
+    def _add_timing(response):
+        spans = pop_request_spans()
+        if spans:
+            header = server_timing_header(spans)
+            logger.info(f"Etapas {request.path}: {header}")
+            if TIMING_HEADER:
+                response.headers['Server-Timing'] = header
+        return response
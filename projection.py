@@ -0,0 +1,74 @@
+"""
+Projeções de saída dos mapas.
+
+As malhas do IBGE e os pontos chegam em coordenadas geográficas (graus,
+EPSG:4326). Para desenhar em outra projeção, as geometrias de cada área são
+reprojetadas uma única vez e guardadas por (área, CRS); os pontos são
+transformados em lote, com um Transformer do pyproj reaproveitado por CRS.
+"""
+import os
+import threading
+from functools import lru_cache
+from typing import Hashable, Optional, Tuple
+
+import cachetools
+import numpy as np
+from pyproj import CRS, Transformer
+
+from metrics import record_cache, span
+
+# CRS das malhas e dos pontos
+SOURCE_CRS = 'EPSG:4326'
+
+# Projeções oferecidas na interface
+PROJECTIONS = {
+    'EPSG:4326': 'Geográfica (graus)',
+    'EPSG:5880': 'SIRGAS 2000 / Policônica do Brasil',
+    'ESRI:102033': 'Albers equivalente (América do Sul)',
+}
+
+DEFAULT_CRS = os.environ.get('PYMAPS_CRS', SOURCE_CRS)
+
+# Malhas já reprojetadas, por (área, CRS) (1 hora)
+PROJECTED_CACHE = cachetools.TTLCache(maxsize=64, ttl=3600)
+_lock = threading.Lock()
+
+def needs_projection(crs: Optional[str]) -> bool:
+    """Indica se o CRS pedido difere do CRS de origem."""
+    return bool(crs) and crs != SOURCE_CRS
+
+@lru_cache(maxsize=16)
+def get_transformer(crs: str) -> Transformer:
+    """Transformer de SOURCE_CRS para o CRS pedido, criado uma vez por processo."""
+    return Transformer.from_crs(SOURCE_CRS, CRS.from_user_input(crs), always_xy=True)
+
+def project_points(longitudes, latitudes, crs: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Transforma os pontos em lote; sem projeção, retorna longitudes e latitudes."""
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    if not needs_projection(crs) or len(longitudes) == 0:
+        return longitudes, latitudes
+    return get_transformer(crs).transform(longitudes, latitudes)
+
+def project_area(gdf, crs: Optional[str], area_key: Optional[Hashable] = None):
+    """
+    Malha da área no CRS pedido. Com area_key, a reprojeção fica em cache e
+    as próximas renderizações da mesma área e CRS não refazem o cálculo.
+    """
+    if not needs_projection(crs):
+        return gdf
+    key = (area_key, crs)
+    if area_key is not None:
+        with _lock:
+            projected = PROJECTED_CACHE.get(key)
+        if projected is not None:
+            record_cache('malha_projetada', True)
+            return projected
+
+    with span('project'):
+        projected = gdf.to_crs(crs)
+    if area_key is not None:
+        record_cache('malha_projetada', False)
+        with _lock:
+            PROJECTED_CACHE[key] = projected
+    return projected
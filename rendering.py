@@ -0,0 +1,234 @@
+"""
+Ciclo de vida das renderizações e recursos reutilizados entre elas.
+
+As imagens (rosa dos ventos, ícones de marcador) são decodificadas uma
+única vez e guardadas como arrays somente leitura, indexadas pelo hash do
+conteúdo. Os modelos de figura guardam, por layout, a figura com os eixos
+do mapa, o eixo da legenda e a rosa dos ventos já montados. A malha
+desenhada também fica no modelo, marcada pela chave da base (área e estilo
+das bordas): se a próxima renderização usa a mesma base, só os pontos e a
+legenda são refeitos.
+
+As figuras usam a API orientada a objetos (Figure + FigureCanvasAgg), sem o
+registro global do pyplot, e cada renderização roda dentro de
+render_context, que limita quantas renderizações simultâneas cabem no
+orçamento de memória do worker e garante que a figura seja devolvida ou
+descartada mesmo em caso de erro.
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+import cachetools
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Diretório de assets (independe do diretório de trabalho, p.ex. no modo lote)
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Geometria da figura
+FIGSIZE = (15, 15)
+FIGURE_DPI = 300
+LEGEND_RECT = [0.90, 0.15, 0.15, 0.70]
+COMPASS_RECT = [0.3, 0.0, 0.5, 0.3]
+COMPASS_LABEL = 'rosa-dos-ventos'
+
+# Orçamento de memória para renderizações por worker. Cada renderização
+# ocupa cerca de três canvas Agg (~77 MB cada a 15x15 pol e 300 dpi): o
+# canvas cheio, o recortado e o buffer RGBA copiado para a codificação.
+RENDER_MEMORY_BUDGET_MB = int(os.environ.get('PYMAPS_RENDER_MEMORY_MB', 512))
+CANVAS_MB = FIGSIZE[0] * FIGSIZE[1] * FIGURE_DPI ** 2 * 4 / 2 ** 20
+RENDER_MEMORY_ESTIMATE_MB = 3 * CANVAS_MB
+MAX_CONCURRENT_RENDERS = max(1, int(RENDER_MEMORY_BUDGET_MB // RENDER_MEMORY_ESTIMATE_MB))
+
+# Tempo máximo de espera por uma vaga de renderização
+RENDER_SLOT_TIMEOUT = float(os.environ.get('PYMAPS_RENDER_SLOT_TIMEOUT', 60))
+
+# Modelos de figura guardados por processo (cada um mantém um canvas)
+TEMPLATE_POOL_MAX = int(os.environ.get('PYMAPS_TEMPLATE_POOL_MAX', MAX_CONCURRENT_RENDERS))
+
+# Imagens decodificadas, por hash do conteúdo
+IMAGE_ARRAY_CACHE = cachetools.LRUCache(maxsize=64)
+
+_lock = threading.Lock()
+_render_slots = threading.BoundedSemaphore(MAX_CONCURRENT_RENDERS)
+
+class RenderBusyError(RuntimeError):
+    """Nenhuma vaga de renderização livre dentro do tempo de espera."""
+
+class RenderCancelled(RuntimeError):
+    """Renderização abandonada antes de começar (pedido já obsoleto)."""
+
+def decode_image(content: bytes) -> np.ndarray:
+    """Decodifica uma imagem (PNG, JPG, GIF) em array RGBA, com cache por conteúdo."""
+    key = hashlib.sha1(content).hexdigest()
+    with _lock:
+        img = IMAGE_ARRAY_CACHE.get(key)
+    record_cache('imagens', img is not None)
+    if img is None:
+        with Image.open(io.BytesIO(content)) as pil_img:
+            img = np.asarray(pil_img.convert('RGBA'))
+        img.setflags(write=False)
+        with _lock:
+            IMAGE_ARRAY_CACHE[key] = img
+    return img
+
+def decode_data_uri(data_uri: str) -> np.ndarray:
+    """Decodifica uma imagem em data URI (p.ex. o upload do marcador)."""
+    content_type, content_string = data_uri.split(',')
+    return decode_image(base64.b64decode(content_string))
+
+@lru_cache(maxsize=16)
+def load_asset(name: str) -> np.ndarray:
+    """Imagem de assets/, lida do disco uma única vez por processo."""
+    with open(os.path.join(ASSETS_DIR, name), 'rb') as f:
+        return decode_image(f.read())
+
+class FigureTemplate:
+    """Figura pré-montada para um layout (eixos, legenda e rosa dos ventos)."""
+
+    def __init__(self, key):
+        show_axes, show_legend, show_compass = key
+        self.key = key
+        self.base_key = None
+        self._base_artists = set()
+        self._base_datalim = None
+        self.fig = Figure(figsize=FIGSIZE, dpi=FIGURE_DPI)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        if not show_axes:
+            self.ax.set_axis_off()
+
+        self.legend_ax = self.fig.add_axes(LEGEND_RECT)
+        self.legend_ax.set_axis_off()
+
+        if show_legend and show_compass:
+            try:
+                compass_ax = self.legend_ax.inset_axes(COMPASS_RECT,
+                                                       transform=self.legend_ax.transAxes)
+                compass_ax.imshow(load_asset('compass_rose.png'))
+                compass_ax.axis('off')
+                compass_ax.set_label(COMPASS_LABEL)
+            except Exception as e:
+                logger.error(f"Erro ao adicionar rosa dos ventos: {str(e)}")
+
+    def _map_artists(self):
+        ax = self.ax
+        return (list(ax.collections) + list(ax.artists) + list(ax.images) +
+                list(ax.lines) + list(ax.patches) + list(ax.texts))
+
+    def mark_base(self, base_key):
+        """Marca o que já está desenhado como a base (malha) do modelo."""
+        self.base_key = base_key
+        self._base_artists = set(self._map_artists())
+        self._base_datalim = self.ax.dataLim.frozen()
+
+    def reset(self, keep_base=True):
+        """
+        Remove o conteúdo da requisição anterior e a legenda. Com keep_base,
+        a malha marcada por mark_base continua desenhada.
+        """
+        if not keep_base:
+            self.base_key = None
+            self._base_artists = set()
+        ax = self.ax
+        for artist in self._map_artists():
+            if artist not in self._base_artists:
+                artist.remove()
+        if self.base_key is None:
+            ax.relim()
+            ax.set_aspect('auto')
+            ax.autoscale(True)
+        else:
+            # Limites de dados da malha, como logo após desenhá-la
+            ax.dataLim.set(self._base_datalim)
+            ax.ignore_existing_data_limits = False
+            ax.autoscale(True)
+        if self.legend_ax.legend_ is not None:
+            self.legend_ax.legend_.remove()
+
+    def free(self):
+        """Libera a figura e o buffer do canvas sem esperar o coletor de lixo."""
+        self.base_key = None
+        self._base_artists = set()
+        self.fig.clear()
+        # O canvas Agg guarda o último renderer (e seu buffer de pixels)
+        self.fig.canvas.__dict__.pop('renderer', None)
+
+_pool = {}  # layout -> [FigureTemplate livres]
+
+def template_key(show_axes=False, show_legend=True, show_compass=True):
+    """Layout do modelo; sem legenda a rosa dos ventos também não é desenhada."""
+    return (bool(show_axes), bool(show_legend), bool(show_legend and show_compass))
+
+def acquire_template(show_axes=False, show_legend=True, show_compass=True,
+                     base_key=None) -> FigureTemplate:
+    """
+    Empresta um modelo livre do layout pedido, de preferência um que já
+    tenha a base base_key desenhada, ou monta um novo.
+    """
+    key = template_key(show_axes, show_legend, show_compass)
+    with _lock:
+        free = _pool.get(key)
+        template = None
+        if free:
+            index = next((i for i, t in enumerate(free)
+                          if base_key is not None and t.base_key == base_key), -1)
+            template = free.pop(index)
+    record_cache('modelos_figura', template is not None)
+    return template if template is not None else FigureTemplate(key)
+
+def release_template(template: FigureTemplate):
+    """Devolve o modelo ao pool, já limpo, ou o libera se o pool estiver cheio."""
+    try:
+        template.reset()
+        with _lock:
+            pooled = sum(len(free) for free in _pool.values())
+            if pooled < TEMPLATE_POOL_MAX:
+                _pool.setdefault(template.key, []).append(template)
+                return
+    except Exception as e:
+        logger.error(f"Erro ao limpar modelo de figura: {str(e)}")
+    template.free()
+
+@contextmanager
+def render_context(show_axes=False, show_legend=True, show_compass=True,
+                   base_key=None, timeout=RENDER_SLOT_TIMEOUT):
+    """
+    Reserva uma vaga de renderização e empresta um modelo de figura (com a
+    base base_key já desenhada, se houver um assim no pool). Ao sair,
+    o modelo volta ao pool; se houve erro, é descartado (pode estar em estado
+    inconsistente). A vaga é sempre liberada.
+    """
+    if not _render_slots.acquire(timeout=timeout):
+        raise RenderBusyError(
+            f"Sem vaga de renderização após {timeout:.0f} s "
+            f"({MAX_CONCURRENT_RENDERS} simultâneas por worker)"
+        )
+    template = None
+    try:
+        template = acquire_template(show_axes, show_legend, show_compass, base_key)
+        yield template
+    except RenderCancelled:
+        # Nada foi desenhado: o modelo volta ao pool normalmente
+        raise
+    except BaseException:
+        if template is not None:
+            template.free()
+            template = None
+        raise
+    finally:
+        if template is not None:
+            release_template(template)
+        _render_slots.release()
@@ -0,0 +1,206 @@
+"""
+Pequenos múltiplos: o mesmo conjunto de pontos em um painel por UF.
+
+Para comparar todas as UFs de uma região (ou as 27 do Brasil) em uma única
+figura, sem um mapa completo por UF:
+
+- as malhas das UFs são buscadas de uma vez, em paralelo (fetch_malhas);
+- os pontos são distribuídos entre os painéis numa única junção espacial,
+  contra um índice (STRtree) com os municípios de todas as UFs, sem
+  dissolver nenhuma malha;
+- os painéis, pequenos e em resolução reduzida, são desenhados em paralelo
+  num pool de processos;
+- a grade é montada sobre os pixels dos painéis, com uma legenda única.
+
+Marcadores de imagem não são usados nos painéis: a camada usa o símbolo e
+a cor.
+"""
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from PIL import Image
+
+from data_utils import get_area_name, get_locality_table
+from map_utils import MALHA_URLS, encode_png, fetch_malhas
+from metrics import span
+from projection import project_area, project_points
+from rendering import FIGSIZE
+
+logger = logging.getLogger(__name__)
+
+# Lado de cada painel (polegadas)
+PANEL_SIZE = 4
+
+# Resolução dos painéis (a dos mapas completos gera grades de centenas de MB)
+PANEL_DPI = float(os.environ.get('PYMAPS_PANEL_DPI', 100))
+
+# Altura da faixa da legenda compartilhada (polegadas)
+PANEL_LEGEND_HEIGHT = 0.6
+
+def panel_areas(area_type: str, area_id=None) -> List[int]:
+    """Ids das UFs que viram painéis: todas (brasil) ou as da região."""
+    table = get_locality_table()
+    if table is None:
+        raise RuntimeError("Tabela de localidades indisponível")
+    if area_type == 'brasil':
+        return table.uf_ids.tolist()
+    if area_type == 'region':
+        return table.children(area_id)
+    raise ValueError(f"Pequenos múltiplos são por UF de uma região ou do Brasil, não {area_type}")
+
+def fetch_panel_meshes(uf_ids: Sequence[int]) -> Tuple[List, List[Optional[str]]]:
+    """Malhas das UFs (com municípios), buscadas em paralelo; erros por painel."""
+    urls = [MALHA_URLS['uf'].format(area_id=uf_id) for uf_id in uf_ids]
+    results = fetch_malhas(urls)
+    return [results[url][0] for url in urls], [results[url][1] for url in urls]
+
+def partition_points(latitudes, longitudes, meshes: Sequence) -> List[np.ndarray]:
+    """
+    Índices dos pontos de cada painel, numa única consulta ao STRtree com as
+    feições de todas as malhas. Pontos sobre a divisa de duas UFs aparecem
+    nos dois painéis; os de fora de todas, em nenhum.
+    """
+    with span('point_filter'):
+        geometries = []
+        owners = []
+        for panel, gdf in enumerate(meshes):
+            if gdf is None:
+                continue
+            geometries.append(np.asarray(gdf.geometry.array))
+            owners.append(np.full(len(gdf), panel))
+        if not geometries or len(latitudes) == 0:
+            return [np.empty(0, dtype=np.int64) for _ in meshes]
+
+        tree = shapely.STRtree(np.concatenate(geometries))
+        owners = np.concatenate(owners)
+        points = shapely.points(np.asarray(longitudes, dtype=float),
+                                np.asarray(latitudes, dtype=float))
+        point_index, feature_index = tree.query(points, predicate='intersects')
+
+        # Um par (painel, ponto) por ponto, mesmo na divisa entre municípios;
+        # já ordenados por painel
+        pairs = np.unique(np.column_stack([owners[feature_index], point_index]), axis=0)
+        bounds = np.searchsorted(pairs[:, 0], np.arange(len(meshes) + 1))
+        return [pairs[bounds[i]:bounds[i + 1], 1] for i in range(len(meshes))]
+
+def render_panel(gdf, title, x, y, style: Dict) -> np.ndarray:
+    """Desenha um painel (malha, pontos e título) e retorna seus pixels RGBA."""
+    fig = Figure(figsize=(PANEL_SIZE, PANEL_SIZE), dpi=PANEL_DPI)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0.02, 0.02, 0.96, 0.86])
+    ax.set_axis_off()
+    if gdf is not None:
+        gdf.plot(ax=ax, color=style['color_map'], edgecolor=style['color_border'],
+                 linewidth=style['border_thickness'])
+    if len(x):
+        # Mesmo tamanho relativo dos marcadores do mapa completo
+        size = style['marker_size'] * 10 * PANEL_SIZE / FIGSIZE[0]
+        ax.scatter(x, y, c=style['color_marker'], s=size ** 2, marker=style['marker_style'])
+    fig.text(0.5, 0.97, title, ha='center', va='top', fontsize=12)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+def _render_panel_args(args):
+    return render_panel(*args)
+
+def render_legend(width: int, area_name: str, style: Dict) -> np.ndarray:
+    """Faixa com a legenda compartilhada, na largura da grade (pixels)."""
+    fig = Figure(figsize=(width / PANEL_DPI, PANEL_LEGEND_HEIGHT), dpi=PANEL_DPI)
+    canvas = FigureCanvasAgg(fig)
+    handles = [Patch(facecolor=style['color_map'], edgecolor='none')]
+    labels = [area_name]
+    if style['layer_name']:
+        handles.append(Line2D([0], [0], marker=style['marker_style'], color='w',
+                              markerfacecolor=style['color_marker'], markersize=10))
+        labels.append(style['layer_name'])
+    fig.legend(handles, labels, loc='center', ncol=len(handles), fontsize=12, frameon=False)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())
+
+def compose_grid(panels: Sequence[np.ndarray], columns: int, legend=None) -> np.ndarray:
+    """Monta os painéis (todos do mesmo tamanho) em grade, com a legenda embaixo."""
+    height, width = panels[0].shape[:2]
+    rows = math.ceil(len(panels) / columns)
+    legend_height = 0 if legend is None else legend.shape[0]
+    grid = Image.new('RGBA', (columns * width, rows * height + legend_height), 'white')
+    for i, panel in enumerate(panels):
+        row, col = divmod(i, columns)
+        grid.paste(Image.fromarray(panel, 'RGBA'), (col * width, row * height))
+    if legend is not None:
+        grid.paste(Image.fromarray(np.ascontiguousarray(legend), 'RGBA'), (0, rows * height))
+    return np.asarray(grid)
+
+def render_small_multiples(area_type, area_id, latitudes, longitudes, layer_name='Pontos',
+                           marker_style='o', color_marker='#f9b347', marker_size=1.0,
+                           color_map='#044c6d', color_border='#ffffff', border_thickness=0.5,
+                           columns=None, processes=None, crs=None) -> Tuple[bytes, Dict]:
+    """
+    PNG com um painel por UF da área (região ou Brasil) e o relatório com
+    os tempos de cada etapa. Os painéis são desenhados em processos
+    (processes=1 desenha tudo neste processo).
+    """
+    report = {}
+    style = {'layer_name': layer_name, 'marker_style': marker_style,
+             'color_marker': color_marker, 'marker_size': marker_size,
+             'color_map': color_map, 'color_border': color_border,
+             'border_thickness': border_thickness}
+
+    start = time.perf_counter()
+    uf_ids = panel_areas(area_type, area_id)
+    if not uf_ids:
+        raise RuntimeError(f"Nenhuma UF encontrada para {area_type} {area_id}")
+    meshes, errors = fetch_panel_meshes(uf_ids)
+    for uf_id, error in zip(uf_ids, errors):
+        if error:
+            logger.error(f"Painel da UF {uf_id} sem malha: {error}")
+    if all(gdf is None for gdf in meshes):
+        raise RuntimeError("Nenhuma malha de UF carregada")
+    report['panels'] = len(uf_ids)
+    report['fetch_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if latitudes is None:
+        latitudes = longitudes = np.empty(0)
+    panel_points = partition_points(latitudes, longitudes, meshes)
+    x, y = project_points(longitudes, latitudes, crs)
+    x, y = np.asarray(x), np.asarray(y)
+    report['points'] = int(sum(len(rows) for rows in panel_points))
+    report['partition_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    args = []
+    for uf_id, gdf, rows in zip(uf_ids, meshes, panel_points):
+        if gdf is not None:
+            gdf = project_area(gdf, crs, ('uf', uf_id))
+        title = f"{get_area_name('uf', uf_id)} ({len(rows)})"
+        args.append((gdf, title, x[rows], y[rows], style))
+
+    with span('panels'):
+        if processes == 1 or len(args) <= 1:
+            panels = [_render_panel_args(a) for a in args]
+        else:
+            processes = min(processes or os.cpu_count() or 1, len(args))
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                panels = list(executor.map(_render_panel_args, args))
+    report['render_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = columns or math.ceil(math.sqrt(len(panels)))
+    columns = min(columns, len(panels))
+    area_name = 'Brasil' if area_type == 'brasil' else get_area_name(area_type, area_id)
+    with span('encode'):
+        legend = render_legend(columns * panels[0].shape[1], area_name, style)
+        content = encode_png(compose_grid(panels, columns, legend))
+    report['bytes'] = len(content)
+    report['compose_s'] = time.perf_counter() - start
+    return content, report
@@ -0,0 +1,110 @@
+"""
+Modo vetorial do mapa: malha simplificada e pontos enviados ao navegador.
+
+Em vez de uma imagem renderizada no servidor, o navegador recebe os
+contornos da área e os pontos filtrados de cada camada, e monta a figura
+Plotly no cliente (assets/map_vector.js). Cores, espessura das bordas,
+estilo dos marcadores e as opções de eixos, legenda e rosa dos ventos são
+aplicados no navegador, sem chamada ao servidor.
+
+Os contornos são simplificados (tolerância proporcional à extensão da área)
+e quantizados numa grade, como no TopoJSON: as coordenadas são arredondadas
+para a resolução da grade e vértices repetidos são descartados. O resultado
+fica em cache por área.
+"""
+import math
+import os
+import threading
+from typing import Dict, Hashable, List, Optional
+
+import cachetools
+import numpy as np
+import shapely
+
+from metrics import record_cache, span
+
+# Tolerância da simplificação, como fração da maior dimensão da área
+VECTOR_SIMPLIFY_RATIO = float(os.environ.get('PYMAPS_VECTOR_SIMPLIFY', 0.0005))
+
+# Divisões da grade de quantização na maior dimensão da área
+VECTOR_QUANTIZATION = int(os.environ.get('PYMAPS_VECTOR_QUANTIZATION', 10000))
+
+# Casas decimais das coordenadas dos pontos (5 casas ~ 1 m)
+POINT_DECIMALS = 5
+
+# Contornos simplificados e quantizados, por área (1 hora)
+VECTOR_CACHE = cachetools.TTLCache(maxsize=64, ttl=3600)
+_lock = threading.Lock()
+
+def _grid_decimals(extent: float) -> int:
+    """Casas decimais equivalentes a uma célula da grade de quantização."""
+    step = extent / max(VECTOR_QUANTIZATION, 1)
+    if step <= 0:
+        return POINT_DECIMALS
+    return int(min(max(math.ceil(-math.log10(step)), 0), 7))
+
+def _with_gaps(values: np.ndarray, breaks: np.ndarray) -> List[Optional[float]]:
+    """Lista JSON das coordenadas com None entre os anéis (separador do Plotly)."""
+    result = values.astype(object)
+    result = np.insert(result, breaks, None)
+    return result.tolist()
+
+def boundary_payload(gdf, area_key: Optional[Hashable] = None) -> Dict:
+    """
+    Contornos da área simplificados e quantizados, em duas listas x/y com os
+    anéis separados por None. Com area_key, o resultado fica em cache.
+    """
+    if area_key is not None:
+        with _lock:
+            payload = VECTOR_CACHE.get(area_key)
+        if payload is not None:
+            record_cache('malha_vetorial', True)
+            return payload
+
+    with span('vector'):
+        minx, miny, maxx, maxy = (float(v) for v in gdf.total_bounds)
+        extent = max(maxx - minx, maxy - miny)
+        geometries = np.asarray(gdf.geometry.array)
+        if VECTOR_SIMPLIFY_RATIO > 0:
+            geometries = shapely.simplify(geometries, extent * VECTOR_SIMPLIFY_RATIO,
+                                          preserve_topology=True)
+
+        rings = shapely.get_rings(shapely.get_parts(geometries))
+        coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+        decimals = _grid_decimals(extent)
+        coords = np.round(coords, decimals)
+
+        # Vértices que caíram na mesma célula do anterior, no mesmo anel
+        same_ring = np.r_[False, ring_index[1:] == ring_index[:-1]]
+        repeated = same_ring & np.r_[False, np.all(coords[1:] == coords[:-1], axis=1)]
+        coords, ring_index = coords[~repeated], ring_index[~repeated]
+
+        breaks = np.flatnonzero(ring_index[1:] != ring_index[:-1]) + 1
+        payload = {
+            'bounds': [minx, miny, maxx, maxy],
+            'x': _with_gaps(coords[:, 0], breaks),
+            'y': _with_gaps(coords[:, 1], breaks),
+            'vertices': int(len(coords)),
+        }
+
+    if area_key is not None:
+        record_cache('malha_vetorial', False)
+        with _lock:
+            VECTOR_CACHE[area_key] = payload
+    return payload
+
+def vector_payload(gdf, area_name: str, area_key: Optional[Hashable], layers) -> Dict:
+    """
+    Dados do modo vetorial: contornos da área e pontos já filtrados de cada
+    camada, na ordem da pilha. O estilo das camadas não vai no payload; o
+    navegador o lê de layers-store e layer-styles.
+    """
+    return {
+        'area_name': area_name,
+        'boundary': boundary_payload(gdf, area_key),
+        'layers': [{
+            'name': layer.name,
+            'x': np.round(layer.longitudes, POINT_DECIMALS).tolist(),
+            'y': np.round(layer.latitudes, POINT_DECIMALS).tolist(),
+        } for layer in layers],
+    }